@@ -0,0 +1,143 @@
+import asyncio
+import os
+from concurrent.futures import Executor
+from io import BytesIO
+from typing import Union, Any, AsyncIterable
+
+from .batch import PosterSpec, render_poster_spec
+
+AsyncPortrait = Union[str, os.PathLike, bytes, BytesIO, AsyncIterable[bytes], Any]
+
+
+class AsyncWantedPoster:
+    def __init__(self, executor: Executor = None, max_concurrency: int = 4, timeout: float = None) -> None:
+        """
+        Creates an asyncio facade to generate wanted posters without blocking the event loop.
+        Rendering runs in an executor with the same code as WantedPoster.generate, so the output is identical
+        :param executor: The executor to render in. If None, the event loop default executor (a thread pool) is used.
+                         For a process pool, use preload_assets as initializer to warm up the workers
+        :param max_concurrency: The maximum number of posters rendered at the same time. Other calls wait for a slot.
+                                A render that timed out or was cancelled keeps its slot until it actually ends
+        :param timeout: The default maximum time in seconds to wait for a poster, including the time waiting for a
+                        slot. If None, no limit
+        :return: None
+        """
+
+        self.executor: Executor = executor
+        self.timeout: float = timeout
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def generate(self, portrait: AsyncPortrait = None, first_name: str = '', last_name: str = '',
+                       bounty: int = 0, timeout: float = None, **generate_kwargs) -> Any:
+        """
+        Generates a wanted poster in the executor.
+        If the call is cancelled or times out while the poster is rendering, the render is left to finish in the
+        background but its result is discarded
+        :param portrait: The portrait image, either a path (str or path-like), bytes, a BytesIO object, an async stream
+                         with a read() coroutine or an async iterable of bytes chunks
+        :param first_name: The first name of the user
+        :param last_name: The last name of the user
+        :param bounty: The bounty of the user
+        :param timeout: The maximum time in seconds to wait for the poster. If None, the default timeout is used
+        :param generate_kwargs: The arguments passed to WantedPoster.generate. If output_type is not specified,
+                                the poster is returned as bytes
+        :return: The value returned by WantedPoster.generate, the encoded poster bytes by default
+        """
+
+        if timeout is None:
+            timeout = self.timeout
+
+        return await asyncio.wait_for(self.__generate(portrait, first_name, last_name, bounty, generate_kwargs),
+                                      timeout)
+
+    async def __generate(self, portrait: AsyncPortrait, first_name: str, last_name: str, bounty: int,
+                         generate_kwargs: dict) -> Any:
+        """
+        Generates a wanted poster in the executor, waiting for a free slot first
+        :param portrait: The portrait image
+        :param first_name: The first name of the user
+        :param last_name: The last name of the user
+        :param bounty: The bounty of the user
+        :param generate_kwargs: The arguments passed to WantedPoster.generate
+        :return: The value returned by WantedPoster.generate
+        """
+
+        portrait = await _read_portrait(portrait)
+        spec = PosterSpec(portrait, first_name, last_name, bounty, **generate_kwargs)
+
+        await self._semaphore.acquire()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self.executor, render_poster_spec, spec)
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+        # The slot is released when the render ends, not when this call is cancelled or times out, so renders left
+        # running in the background still count against the concurrency limit
+        future.add_done_callback(self.__release_slot)
+
+        return await asyncio.shield(future)
+
+    def __release_slot(self, future: asyncio.Future) -> None:
+        """
+        Releases the slot of a render that ended
+        :param future: The future of the render
+        :return: None
+        """
+
+        self._semaphore.release()
+
+        # Retrieve the error of a render whose caller is gone, so that it is not reported as never retrieved
+        if not future.cancelled():
+            future.exception()
+
+
+async def agenerate(portrait: AsyncPortrait = None, first_name: str = '', last_name: str = '', bounty: int = 0,
+                    **generate_kwargs) -> Any:
+    """
+    Generates a wanted poster in the event loop default executor, without a concurrency limit.
+    Use AsyncWantedPoster to configure the executor, concurrency and timeouts
+    :param portrait: The portrait image, either a path (str or path-like), bytes, a BytesIO object or an async stream
+    :param first_name: The first name of the user
+    :param last_name: The last name of the user
+    :param bounty: The bounty of the user
+    :param generate_kwargs: The arguments passed to WantedPoster.generate
+    :return: The value returned by WantedPoster.generate, the encoded poster bytes by default
+    """
+
+    portrait = await _read_portrait(portrait)
+    spec = PosterSpec(portrait, first_name, last_name, bounty, **generate_kwargs)
+
+    return await asyncio.get_running_loop().run_in_executor(None, render_poster_spec, spec)
+
+
+async def _read_portrait(portrait: AsyncPortrait) -> Union[str, BytesIO, None]:
+    """
+    Reads the portrait into a form that can be passed to the executor
+    :param portrait: The portrait image
+    :return: The portrait path or a BytesIO object with its content
+    """
+
+    if portrait is None or isinstance(portrait, (str, BytesIO)):
+        return portrait
+
+    if isinstance(portrait, os.PathLike):
+        return os.fspath(portrait)
+
+    if isinstance(portrait, (bytes, bytearray, memoryview)):
+        return BytesIO(portrait)
+
+    # Async stream, e.g. asyncio.StreamReader or aiofiles
+    if hasattr(portrait, 'read') and asyncio.iscoroutinefunction(portrait.read):
+        return BytesIO(await portrait.read())
+
+    # Async iterable of chunks, e.g. an HTTP response body
+    if hasattr(portrait, '__aiter__'):
+        portrait_bytes = BytesIO()
+        async for chunk in portrait:
+            portrait_bytes.write(chunk)
+        portrait_bytes.seek(0)
+        return portrait_bytes
+
+    raise TypeError(f'Unsupported portrait type: {type(portrait).__name__}')
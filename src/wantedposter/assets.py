@@ -0,0 +1,182 @@
+import os
+import threading
+from io import BytesIO
+from typing import Union, Iterable, Tuple, Dict
+
+from PIL import Image, ImageFont
+
+from .bundle import AssetBundle
+
+
+class AssetRegistry:
+    def __init__(self, images: Iterable[Tuple[str, Union[str, None]]] = (),
+                 fonts: Iterable[Tuple[str, int]] = (), bundle_path: str = None) -> None:
+        """
+        Creates a thread-safe registry of decoded poster assets.
+        Each asset is decoded once per process and shared by every caller.
+        :param images: The (path, mode) pairs of the images loaded by warm_up. If mode is None, the image is kept
+                       in its original mode
+        :param fonts: The (path, size) pairs of the fonts loaded by warm_up
+        :param bundle_path: The path of the precompiled asset bundle (see bundle.py), assets found in it are mapped
+                            instead of decoded. If None or missing, the asset files are used
+        :return: None
+        """
+
+        self.images: list[Tuple[str, Union[str, None]]] = list(images)
+        self.fonts: list[Tuple[str, int]] = list(fonts)
+        self.bundle_path: Union[str, None] = bundle_path
+
+        self._lock = threading.Lock()
+        self._images: Dict[Tuple[str, Union[str, None]], Image.Image] = {}
+        self._font_data: Dict[str, bytes] = {}
+        # FreeType faces are not safe to share between threads, so each thread gets its own font objects
+        self._thread_fonts = threading.local()
+        self._version: Union[str, None] = None
+        # The opened bundle, False if there is none
+        self._bundle: Union[AssetBundle, bool, None] = None
+
+    def warm_up(self) -> None:
+        """
+        Decodes all the registered assets, so that the first render does not pay the loading cost.
+        Call this at process start (e.g. in a worker initializer)
+        :return: None
+        """
+
+        for path, mode in self.images:
+            self.__load_image(path, mode)
+
+        for path, size in self.fonts:
+            self.get_font(path, size)
+
+    def clear(self) -> None:
+        """
+        Drops all the decoded assets. They will be lazily loaded again on next access
+        :return: None
+        """
+
+        with self._lock:
+            self._images.clear()
+            self._font_data.clear()
+            self._version = None
+            # The mapping is released once the images loaded from it are no longer used
+            self._bundle = None
+        self._thread_fonts = threading.local()
+
+    def get_version(self) -> str:
+        """
+        Gets a digest of the content of all the registered asset files, which changes whenever an asset changes
+        :return: The digest
+        """
+
+        if self._version is None:
+            bundle = self.__get_bundle()
+            if bundle is not None and bundle.is_complete:
+                self._version = bundle.version
+                return self._version
+
+            import hashlib  # Imported here, it is slow to import and only needed without a complete bundle
+
+            version_hash = hashlib.blake2b(digest_size=16)
+            for path in sorted({path for path, _ in self.images} | {path for path, _ in self.fonts}):
+                with open(path, 'rb') as asset_file:
+                    version_hash.update(asset_file.read())
+            self._version = version_hash.hexdigest()
+
+        return self._version
+
+    def get_image(self, path: str, mode: str = None, copy: bool = True) -> Image.Image:
+        """
+        Gets a decoded image, loading it on first access
+        :param path: The path to the image
+        :param mode: The mode to convert the image to. If None, the original mode is kept
+        :param copy: Whether to return a copy that the caller can safely mutate.
+                     If False, the shared image is returned and must be treated as read-only
+        :return: The image
+        """
+
+        image = self.__load_image(path, mode)
+
+        return image.copy() if copy else image
+
+    def get_font(self, path: str, size: int) -> ImageFont.FreeTypeFont:
+        """
+        Gets a font for the calling thread, loading the font file on first access
+        :param path: The path to the font file
+        :param size: The font size
+        :return: The font
+        """
+
+        fonts: Dict[Tuple[str, int], ImageFont.FreeTypeFont] = getattr(self._thread_fonts, 'fonts', None)
+        if fonts is None:
+            fonts = self._thread_fonts.fonts = {}
+
+        key = (path, size)
+        font = fonts.get(key)
+        if font is None:
+            font = ImageFont.truetype(BytesIO(self.__load_font_data(path)), size)
+            fonts[key] = font
+
+        return font
+
+    def __load_image(self, path: str, mode: Union[str, None]) -> Image.Image:
+        """
+        Gets a decoded image from the registry, decoding it if not yet loaded
+        :param path: The path to the image
+        :param mode: The mode to convert the image to
+        :return: The shared image
+        """
+
+        key = (path, mode)
+        image = self._images.get(key)
+        if image is not None:
+            return image
+
+        with self._lock:
+            # Another thread might have loaded it while waiting for the lock
+            image = self._images.get(key)
+            if image is None:
+                bundle = self.__get_bundle()
+                image = bundle.get_image(path, mode) if bundle is not None else None
+                if image is None:
+                    with Image.open(path) as opened_image:
+                        image = opened_image.convert(mode) if mode is not None else opened_image.copy()
+                    image.load()
+                self._images[key] = image
+
+        return image
+
+    def __load_font_data(self, path: str) -> bytes:
+        """
+        Gets the raw content of a font file, reading it if not yet loaded
+        :param path: The path to the font file
+        :return: The font file content
+        """
+
+        data = self._font_data.get(path)
+        if data is not None:
+            return data
+
+        with self._lock:
+            data = self._font_data.get(path)
+            if data is None:
+                bundle = self.__get_bundle()
+                data = bundle.get_font_data(path) if bundle is not None else None
+                if data is None:
+                    with open(path, 'rb') as font_file:
+                        data = font_file.read()
+                self._font_data[path] = data
+
+        return data
+
+    def __get_bundle(self) -> Union[AssetBundle, None]:
+        """
+        Gets the asset bundle, opening it on first access
+        :return: The bundle, or None if there is none
+        """
+
+        if self._bundle is None:
+            self._bundle = False
+            if self.bundle_path is not None and os.path.exists(self.bundle_path):
+                self._bundle = AssetBundle(self.bundle_path)
+
+        return self._bundle or None
@@ -0,0 +1,179 @@
+import os
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from io import BytesIO
+from typing import Union, Iterable, Iterator, Any, Dict, Tuple, Callable
+
+from .wantedposter import (WantedPoster, OutputType, HorizontalAlignment, VerticalAlignment, CaptureCondition, Effect,
+                           Stamp, preload_assets)
+
+# Options that are converted from their name to an enum
+ENUM_OPTIONS = {
+    'portrait_horizontal_align': HorizontalAlignment,
+    'portrait_vertical_align': VerticalAlignment,
+    'capture_condition': CaptureCondition,
+    'stamp': Stamp
+}
+
+GENERATE_OPTIONS = {'portrait_horizontal_align', 'portrait_vertical_align', 'should_make_portrait_transparent',
+                    'portrait_transparency_value', 'full_name_max_length', 'use_space_sub', 'capture_condition',
+                    'effects', 'stamp', 'output_format', 'save_options'}
+
+
+class PosterSpec:
+    def __init__(self, portrait: Union[str, BytesIO] = None, first_name: str = '', last_name: str = '',
+                 bounty: int = 0, **generate_kwargs) -> None:
+        """
+        Creates the specification of a poster to be rendered
+        :param portrait: The portrait image, either a path to the image or a BytesIO object
+        :param first_name: The first name of the user
+        :param last_name: The last name of the user
+        :param bounty: The bounty of the user
+        :param generate_kwargs: The arguments passed to WantedPoster.generate (e.g. capture_condition, effects, stamp).
+                                If output_type is not specified, the poster is returned as bytes
+        :return: None
+        """
+
+        self.portrait: Union[str, BytesIO] = portrait
+        self.first_name: str = first_name
+        self.last_name: str = last_name
+        self.bounty: int = bounty
+        self.generate_kwargs: Dict[str, Any] = generate_kwargs
+        self.generate_kwargs.setdefault('output_type', OutputType.BYTES)
+
+    def create_poster(self) -> WantedPoster:
+        """
+        Creates the Wanted Poster object of this specification
+        :return: The Wanted Poster object
+        """
+
+        return WantedPoster(self.portrait, self.first_name, self.last_name, self.bounty)
+
+
+class BatchResult:
+    def __init__(self, index: int, spec: PosterSpec, result: Any = None, error: BaseException = None) -> None:
+        """
+        Creates the result of a rendered poster specification
+        :param index: The position of the specification in the batch
+        :param spec: The poster specification
+        :param result: The value returned by WantedPoster.generate, None if rendering failed
+        :param error: The exception raised while rendering, None if rendering succeeded
+        :return: None
+        """
+
+        self.index: int = index
+        self.spec: PosterSpec = spec
+        self.result: Any = result
+        self.error: BaseException = error
+
+    @property
+    def ok(self) -> bool:
+        """
+        Whether the poster was rendered successfully
+        :return: True if there was no error
+        """
+
+        return self.error is None
+
+
+def parse_options(options: dict, portrait: Union[bytes, str, None]) -> PosterSpec:
+    """
+    Creates a poster specification from options with enums given by name, as received by the render server or read
+    by the command line
+    :param options: The poster options
+    :param portrait: The portrait image content, the path to the portrait image, or None
+    :return: The poster specification
+    """
+
+    generate_kwargs = {}
+    for option, value in options.items():
+        if option in ('first_name', 'last_name', 'bounty'):
+            continue
+
+        if option not in GENERATE_OPTIONS:
+            raise ValueError(f'Unknown option: {option}')
+
+        if option in ENUM_OPTIONS and value is not None:
+            value = ENUM_OPTIONS[option][value]
+        elif option == 'effects' and value is not None:
+            value = [Effect[effect] for effect in value]
+
+        generate_kwargs[option] = value
+
+    if isinstance(portrait, bytes):
+        portrait = BytesIO(portrait)
+
+    return PosterSpec(portrait, options.get('first_name', ''),
+                      options.get('last_name', ''), int(options.get('bounty', 0)), output_type=OutputType.BYTES,
+                      **generate_kwargs)
+
+
+def render_poster_spec(spec: PosterSpec) -> Any:
+    """
+    Renders a poster specification. Runs in the worker processes
+    :param spec: The poster specification
+    :return: The value returned by WantedPoster.generate
+    """
+
+    return spec.create_poster().generate(**spec.generate_kwargs)
+
+
+def render_batch(specs: Iterable[PosterSpec], max_workers: int = None, max_in_flight: int = None,
+                 executor: Executor = None, render_function: Callable[[PosterSpec], Any] = render_poster_spec
+                 ) -> Iterator[BatchResult]:
+    """
+    Renders poster specifications in parallel, yielding the results as they finish (not in input order).
+    Specifications are consumed lazily, so at most max_in_flight of them are pending at any time
+    :param specs: The poster specifications
+    :param max_workers: The number of worker processes. If None, the number of CPUs. Ignored if executor is given
+    :param max_in_flight: The maximum number of submitted but not yet collected renders. If None, twice the
+                          number of workers
+    :param executor: The executor to use. If None, a process pool with pre-warmed assets is created and shut down
+                     at the end of the batch
+    :param render_function: The function that renders a specification in the workers, its return value is the
+                            result. It must be picklable (defined at module level)
+    :return: An iterator of the results, one for each specification
+    """
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    if max_in_flight is None:
+        max_in_flight = max_workers * 2
+
+    owns_executor = executor is None
+    if owns_executor:
+        executor = ProcessPoolExecutor(max_workers=max_workers, initializer=preload_assets)
+
+    pending: Dict[Future, Tuple[int, PosterSpec]] = {}
+    try:
+        for index, spec in enumerate(specs):
+            # Wait for a slot before submitting more work
+            while len(pending) >= max_in_flight:
+                yield from _collect_completed(pending)
+
+            pending[executor.submit(render_function, spec)] = (index, spec)
+
+        while len(pending) > 0:
+            yield from _collect_completed(pending)
+    finally:
+        for future in pending:
+            future.cancel()
+
+        if owns_executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _collect_completed(pending: Dict[Future, Tuple[int, PosterSpec]]) -> Iterator[BatchResult]:
+    """
+    Waits for at least one pending render to finish and yields the results of the completed ones
+    :param pending: The pending futures, with the index and specification they were submitted for
+    :return: An iterator of the results of the completed renders
+    """
+
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in done:
+        index, spec = pending.pop(future)
+        try:
+            yield BatchResult(index, spec, result=future.result())
+        except Exception as e:
+            yield BatchResult(index, spec, error=e)
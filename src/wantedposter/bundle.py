@@ -0,0 +1,216 @@
+"""
+Precompiled asset bundle.
+
+    python -m wantedposter.bundle
+
+Packs the registered images, already decoded to raw pixels, and the font files into a single file, that is memory
+mapped at runtime instead of opening and decoding each asset. Build it once per install (e.g. in the container image);
+without it, or for assets that changed since it was built, the asset files are used.
+"""
+import mmap
+import os
+import struct
+from typing import Union, Iterable, Tuple, Dict
+
+from PIL import Image
+
+ASSET_BUNDLE_MAGIC = b'WPAB'
+ASSET_BUNDLE_FORMAT_VERSION = 1
+ASSET_BUNDLE_ALIGNMENT = 64
+
+# Magic, format version and index length
+_HEADER = struct.Struct('<4sIQ')
+
+
+def build_asset_bundle(bundle_path: str, images: Iterable[Tuple[str, Union[str, None]]], fonts: Iterable[str],
+                       version: str) -> None:
+    """
+    Builds an asset bundle. The file is replaced atomically, so running workers keep their mapping of the old one
+    :param bundle_path: The path of the bundle
+    :param images: The (path, mode) pairs of the images, decoded as AssetRegistry does
+    :param fonts: The paths of the font files
+    :param version: The asset version the bundle is built from, see AssetRegistry.get_version
+    :return: None
+    """
+
+    bundle_dir = os.path.dirname(os.path.abspath(bundle_path))
+    blobs = []
+    index = {'version': version, 'images': [], 'fonts': []}
+
+    for path, mode in images:
+        with Image.open(path) as opened_image:
+            image = opened_image.convert(mode) if mode is not None else opened_image.copy()
+
+        blobs.append(image.tobytes())
+        index['images'].append({'source': _get_source_info(path, bundle_dir), 'mode': mode,
+                                'image_mode': image.mode, 'size': image.size})
+
+    for path in fonts:
+        with open(path, 'rb') as font_file:
+            blobs.append(font_file.read())
+        index['fonts'].append({'source': _get_source_info(path, bundle_dir)})
+
+    # Offsets are relative to the start of the data, which follows the index
+    offset = 0
+    for entry, blob in zip(index['images'] + index['fonts'], blobs):
+        entry['offset'] = offset
+        entry['length'] = len(blob)
+        offset = _align(offset + len(blob))
+
+    import json  # Imported here, it is slow to import and only needed to build the bundle
+
+    index_data = json.dumps(index).encode()
+    data_start = _align(_HEADER.size + len(index_data))
+
+    temporary_path = bundle_path + '.tmp'
+    with open(temporary_path, 'wb') as bundle_file:
+        bundle_file.write(_HEADER.pack(ASSET_BUNDLE_MAGIC, ASSET_BUNDLE_FORMAT_VERSION, len(index_data)))
+        bundle_file.write(index_data)
+        for entry, blob in zip(index['images'] + index['fonts'], blobs):
+            bundle_file.seek(data_start + entry['offset'])
+            bundle_file.write(blob)
+    os.replace(temporary_path, bundle_path)
+
+
+def _get_source_info(path: str, bundle_dir: str) -> dict:
+    """
+    Gets what identifies an asset file in the bundle
+    :param path: The path of the asset
+    :param bundle_dir: The directory of the bundle, paths are stored relative to it
+    :return: The relative path, size and modification time of the asset
+    """
+
+    stat = os.stat(path)
+    return {'path': os.path.relpath(os.path.abspath(path), bundle_dir), 'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns}
+
+
+def _align(offset: int) -> int:
+    """
+    Rounds an offset up to the bundle alignment
+    :param offset: The offset
+    :return: The aligned offset
+    """
+
+    return -(-offset // ASSET_BUNDLE_ALIGNMENT) * ASSET_BUNDLE_ALIGNMENT
+
+
+class AssetBundle:
+    def __init__(self, bundle_path: str) -> None:
+        """
+        Opens an asset bundle and maps it in memory. The mapping is shared by every image loaded from it, and by the
+        processes that open the same bundle
+        :param bundle_path: The path of the bundle
+        :return: None
+        """
+
+        self.bundle_path: str = bundle_path
+
+        with open(bundle_path, 'rb') as bundle_file:
+            self._mmap = mmap.mmap(bundle_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, format_version, index_length = _HEADER.unpack_from(self._mmap)
+        if magic != ASSET_BUNDLE_MAGIC or format_version != ASSET_BUNDLE_FORMAT_VERSION:
+            raise ValueError(f'Unsupported asset bundle: {bundle_path}')
+
+        import json  # Imported here, it is slow to import and only needed once the bundle is opened
+
+        index = json.loads(self._mmap[_HEADER.size:_HEADER.size + index_length])
+        self.version: str = index['version']
+        self._data_start: int = _align(_HEADER.size + index_length)
+
+        bundle_dir = os.path.dirname(os.path.abspath(bundle_path))
+        self._images: Dict[Tuple[str, Union[str, None]], dict] = {}
+        for entry in index['images']:
+            if self.__is_current(entry['source'], bundle_dir):
+                self._images[(self.__get_path(entry['source'], bundle_dir), entry['mode'])] = entry
+
+        self._fonts: Dict[str, dict] = {}
+        for entry in index['fonts']:
+            if self.__is_current(entry['source'], bundle_dir):
+                self._fonts[self.__get_path(entry['source'], bundle_dir)] = entry
+
+        # Any stale asset changes the version of the whole set
+        self.is_complete: bool = (len(self._images) == len(index['images'])
+                                  and len(self._fonts) == len(index['fonts']))
+
+    def get_image(self, path: str, mode: Union[str, None]) -> Union[Image.Image, None]:
+        """
+        Gets an image from the bundle. L and RGBA images share the mapped memory, RGB images are unpacked from it.
+        The images are read-only: PIL copies them on the first in-place change
+        :param path: The path of the image
+        :param mode: The mode the image was converted to, or None
+        :return: The image, or None if not in the bundle or changed since the bundle was built
+        """
+
+        entry = self._images.get((os.path.abspath(path), mode))
+        if entry is None:
+            return None
+
+        start = self._data_start + entry['offset']
+        buffer = memoryview(self._mmap)[start:start + entry['length']]
+        image_mode = entry['image_mode']
+
+        return Image.frombuffer(image_mode, tuple(entry['size']), buffer, 'raw', image_mode, 0, 1)
+
+    def get_font_data(self, path: str) -> Union[bytes, None]:
+        """
+        Gets the content of a font file from the bundle
+        :param path: The path of the font file
+        :return: The content, or None if not in the bundle or changed since the bundle was built
+        """
+
+        entry = self._fonts.get(os.path.abspath(path))
+        if entry is None:
+            return None
+
+        start = self._data_start + entry['offset']
+        return self._mmap[start:start + entry['length']]
+
+    @staticmethod
+    def __get_path(source: dict, bundle_dir: str) -> str:
+        """
+        Gets the absolute path of an asset of the bundle
+        :param source: The source info of the asset
+        :param bundle_dir: The directory of the bundle
+        :return: The path
+        """
+
+        return os.path.abspath(os.path.join(bundle_dir, source['path']))
+
+    @staticmethod
+    def __is_current(source: dict, bundle_dir: str) -> bool:
+        """
+        Whether an asset is unchanged since the bundle was built. Assets whose file was removed are kept
+        :param source: The source info of the asset
+        :param bundle_dir: The directory of the bundle
+        :return: True if the bundled asset can be used
+        """
+
+        try:
+            stat = os.stat(AssetBundle.__get_path(source, bundle_dir))
+        except FileNotFoundError:
+            return True
+
+        return stat.st_size == source['size'] and stat.st_mtime_ns == source['mtime_ns']
+
+
+def main():
+    import argparse
+
+    from .wantedposter import ASSET_REGISTRY, BOUNTY_POSTER_ASSET_BUNDLE_PATH
+
+    parser = argparse.ArgumentParser(description='Build the precompiled asset bundle')
+    parser.add_argument('--output', default=BOUNTY_POSTER_ASSET_BUNDLE_PATH, help='The path of the bundle')
+    args = parser.parse_args()
+
+    # Version the bundle from the asset files, not from a previous bundle
+    ASSET_REGISTRY.bundle_path = None
+    ASSET_REGISTRY.clear()
+    build_asset_bundle(args.output, ASSET_REGISTRY.images, sorted({path for path, _ in ASSET_REGISTRY.fonts}),
+                       ASSET_REGISTRY.get_version())
+    print(f'Built {args.output} ({os.path.getsize(args.output) / 1024 / 1024:.1f} MB)')
+
+
+if __name__ == '__main__':
+    main()
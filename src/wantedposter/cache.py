@@ -0,0 +1,119 @@
+import threading
+from collections import OrderedDict
+from typing import Hashable, Union, Dict
+
+from PIL import Image
+
+
+class ImageLRUCache:
+    def __init__(self, max_bytes: int) -> None:
+        """
+        Creates a thread-safe least-recently-used cache of images, bounded by the size of their pixel data
+        :param max_bytes: The maximum total size of the cached images, in bytes. If 0, nothing is cached
+        :return: None
+        """
+
+        self.max_bytes: int = max_bytes
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+        self._lock = threading.Lock()
+        self._images: OrderedDict[Hashable, Image.Image] = OrderedDict()
+        self._current_bytes: int = 0
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Whether the cache can hold any image
+        :return: True if max_bytes is greater than 0
+        """
+
+        return self.max_bytes > 0
+
+    @property
+    def current_bytes(self) -> int:
+        """
+        The total size of the cached images, in bytes
+        :return: The size
+        """
+
+        return self._current_bytes
+
+    def __len__(self) -> int:
+        return len(self._images)
+
+    def get(self, key: Hashable) -> Union[Image.Image, None]:
+        """
+        Gets a cached image. The image is shared and must be treated as read-only, copy it before mutating
+        :param key: The key of the image
+        :return: The image, or None if not cached
+        """
+
+        with self._lock:
+            image = self._images.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+
+            self._images.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key: Hashable, image: Image.Image) -> None:
+        """
+        Caches an image, evicting the least recently used ones if over budget.
+        The image must not be mutated afterwards
+        :param key: The key of the image
+        :param image: The image
+        :return: None
+        """
+
+        image_bytes = self.get_image_bytes(image)
+        if image_bytes > self.max_bytes:
+            return
+
+        with self._lock:
+            previous_image = self._images.pop(key, None)
+            if previous_image is not None:
+                self._current_bytes -= self.get_image_bytes(previous_image)
+
+            self._images[key] = image
+            self._current_bytes += image_bytes
+
+            while self._current_bytes > self.max_bytes:
+                _, evicted_image = self._images.popitem(last=False)
+                self._current_bytes -= self.get_image_bytes(evicted_image)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """
+        Removes all the cached images. Counters are not reset
+        :return: None
+        """
+
+        with self._lock:
+            self._images.clear()
+            self._current_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Gets the cache counters, to help sizing the cache
+        :return: The hits, misses, evictions, number of entries and current and maximum size in bytes
+        """
+
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._images), 'current_bytes': self._current_bytes,
+                    'max_bytes': self.max_bytes}
+
+    @staticmethod
+    def get_image_bytes(image: Image.Image) -> int:
+        """
+        Gets the approximate size of the pixel data of an image
+        :param image: The image
+        :return: The size in bytes
+        """
+
+        width, height = image.size
+        return width * height * len(image.getbands())
@@ -0,0 +1,345 @@
+"""
+Bulk poster generation from the command line.
+
+    wantedposter roster.jsonl --output-dir posters/ --resume
+    cat roster.csv | wantedposter --input-format csv --output-tar - > posters.tar
+
+Each input item is a JSON object (one per line) or a CSV row with the options of the HTTP render server, plus
+'portrait', the path to the portrait image, and 'id', the name of the output file (the line number if missing), e.g.:
+
+    {"id": "luffy", "portrait": "portraits/luffy.jpg", "first_name": "Luffy", "last_name": "Monkey D.",
+     "bounty": 3000000000, "capture_condition": "ONLY_ALIVE", "effects": ["FROST"], "stamp": "WARLORD"}
+
+In CSV rows, effects are separated by ';' and the boolean, numeric and save_options columns are JSON values.
+Posters are rendered in parallel and written as they finish. A JSON result is printed for each item, to stdout or to
+stderr if the archive is written to stdout.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import tarfile
+import time
+import zipfile
+from collections import defaultdict
+from io import BytesIO
+from typing import Union, Iterable, Iterator, TextIO, BinaryIO, Callable, Tuple, Dict
+
+from .batch import PosterSpec, parse_options, render_batch, render_poster_spec
+from .instrumentation import RenderHooks, RenderStage
+from .wantedposter import BOUNTY_POSTER_EXTENSION
+
+# CSV columns that are JSON values instead of strings
+CSV_JSON_OPTIONS = {'should_make_portrait_transparent', 'portrait_transparency_value',
+                    'full_name_max_length', 'use_space_sub', 'save_options'}
+CSV_EFFECTS_SEPARATOR = ';'
+
+
+class StageTimingHooks(RenderHooks):
+    """
+    Accumulates the durations of the stages of a render, in milliseconds
+    """
+
+    def __init__(self) -> None:
+        self.durations: Dict[str, float] = defaultdict(float)
+
+    def on_stage_end(self, stage: RenderStage, duration: float, size: Union[Tuple[int, int], None]) -> None:
+        self.durations[stage.value.lower()] += duration * 1000
+
+
+def render_timed_spec(spec: PosterSpec) -> Tuple[bytes, float, Dict[str, float]]:
+    """
+    Renders a poster specification and times it. Runs in the worker processes
+    :param spec: The poster specification
+    :return: The encoded poster, the render duration and the duration of each stage, in milliseconds
+    """
+
+    hooks = StageTimingHooks()
+    spec.generate_kwargs['hooks'] = hooks
+
+    start = time.perf_counter()
+    poster = render_poster_spec(spec)
+
+    return poster, (time.perf_counter() - start) * 1000, dict(hooks.durations)
+
+
+class DirectoryWriter:
+    def __init__(self, output_dir: str) -> None:
+        """
+        Writes the posters as files of a directory
+        :param output_dir: The directory, created if missing
+        :return: None
+        """
+
+        self.output_dir: str = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+
+    def exists(self, name: str) -> bool:
+        """
+        Whether a poster was already written, by this or a previous run
+        :param name: The file name of the poster
+        :return: True if the file exists
+        """
+
+        return os.path.exists(os.path.join(self.output_dir, name))
+
+    def write(self, name: str, data: bytes) -> None:
+        """
+        Writes a poster. The file is replaced atomically, so an interrupted run never leaves a partial poster
+        :param name: The file name of the poster
+        :param data: The encoded poster
+        :return: None
+        """
+
+        path = os.path.join(self.output_dir, name)
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'wb') as poster_file:
+            poster_file.write(data)
+        os.replace(temporary_path, path)
+
+    def close(self) -> None:
+        pass
+
+
+class TarWriter:
+    def __init__(self, stream: BinaryIO) -> None:
+        """
+        Writes the posters as members of a tar stream
+        :param stream: The stream, it can be unseekable (e.g. stdout)
+        :return: None
+        """
+
+        self._tar = tarfile.open(fileobj=stream, mode='w|')
+
+    def write(self, name: str, data: bytes) -> None:
+        tar_info = tarfile.TarInfo(name)
+        tar_info.size = len(data)
+        tar_info.mtime = int(time.time())
+        tar_info.mode = 0o644
+        self._tar.addfile(tar_info, BytesIO(data))
+
+    def close(self) -> None:
+        self._tar.close()
+
+
+class ZipWriter:
+    def __init__(self, stream: BinaryIO) -> None:
+        """
+        Writes the posters as entries of a zip stream. Posters are already compressed, so they are stored as they are
+        :param stream: The stream, it can be unseekable (e.g. stdout)
+        :return: None
+        """
+
+        self._zip = zipfile.ZipFile(stream, 'w', zipfile.ZIP_STORED)
+
+    def write(self, name: str, data: bytes) -> None:
+        self._zip.writestr(name, data)
+
+    def close(self) -> None:
+        self._zip.close()
+
+
+def read_items(input_file: TextIO, input_format: str) -> Iterator[Tuple[int, Union[dict, Exception]]]:
+    """
+    Reads the input items lazily
+    :param input_file: The input
+    :param input_format: 'jsonl' or 'csv'
+    :return: An iterator of the line number and the options of each item, or the error if the item is invalid
+    """
+
+    if input_format == 'csv':
+        reader = csv.DictReader(input_file)
+        for row in reader:
+            try:
+                yield reader.line_num, parse_csv_row(row)
+            except ValueError as e:
+                yield reader.line_num, e
+        return
+
+    for line_number, line in enumerate(input_file, start=1):
+        if line.strip() == '':
+            continue
+
+        try:
+            item = json.loads(line)
+            if not isinstance(item, dict):
+                raise ValueError('Item must be a JSON object')
+            yield line_number, item
+        except ValueError as e:
+            yield line_number, e
+
+
+def parse_csv_row(row: Dict[str, str]) -> dict:
+    """
+    Converts a CSV row to item options. Empty columns are left out
+    :param row: The row
+    :return: The options
+    """
+
+    item = {}
+    for column, value in row.items():
+        if column is None or value is None or value.strip() == '':
+            continue
+
+        value = value.strip()
+        if column == 'effects':
+            value = [effect.strip() for effect in value.split(CSV_EFFECTS_SEPARATOR) if effect.strip() != '']
+        elif column in CSV_JSON_OPTIONS:
+            value = json.loads(value)
+
+        item[column] = value
+
+    return item
+
+
+def get_output_name(item: dict, line_number: int, output_format: Union[str, None]) -> str:
+    """
+    Gets the file name of the poster of an item
+    :param item: The item options
+    :param line_number: The line number of the item
+    :param output_format: The default image format, used if the item has none
+    :return: The file name
+    """
+
+    item_id = str(item.get('id', line_number))
+    if item_id in ('', '.', '..') or '/' in item_id or '\\' in item_id:
+        raise ValueError(f'Invalid id: {item_id}')
+
+    extension = (item.get('output_format') or output_format or BOUNTY_POSTER_EXTENSION).lower().lstrip('.')
+
+    return f'{item_id}.{extension}'
+
+
+def generate_posters(items: Iterable[Tuple[int, Union[dict, Exception]]],
+                     writer: Union[DirectoryWriter, TarWriter, ZipWriter], emit: Callable[[dict], None],
+                     output_format: str = None, resume: bool = False, max_workers: int = None,
+                     max_in_flight: int = None) -> Dict[str, int]:
+    """
+    Renders the posters of the items in parallel and writes them as they finish. Items are read lazily, so at most
+    max_in_flight posters are held in memory
+    :param items: The line number and options of each item, or the error if the item is invalid
+    :param writer: The writer of the posters
+    :param emit: Called with the result of each item. Its 'output' is the file name of the poster in the directory or
+                 the archive
+    :param output_format: The default image format (e.g. JPEG, PNG, WEBP). If None, JPEG
+    :param resume: Whether to skip the items whose poster already exists. Only for a DirectoryWriter
+    :param max_workers: The number of worker processes. If None, the number of CPUs
+    :param max_in_flight: The maximum number of posters being rendered. If None, twice the number of workers
+    :return: The number of items per status (ok, skipped, error)
+    """
+
+    counts = {'ok': 0, 'skipped': 0, 'error': 0}
+    # Line number and output name of each submitted specification, by submission index
+    submitted: Dict[int, Tuple[int, str]] = {}
+
+    def report(result: dict) -> None:
+        counts[result['status']] += 1
+        emit(result)
+
+    def get_specs() -> Iterator[PosterSpec]:
+        submitted_count = 0
+        for line_number, item in items:
+            name = None
+            try:
+                if isinstance(item, Exception):
+                    raise item
+
+                name = get_output_name(item, line_number, output_format)
+                if resume and writer.exists(name):
+                    report({'line': line_number, 'output': name, 'status': 'skipped'})
+                    continue
+
+                options = {option: value for option, value in item.items() if option not in ('id', 'portrait')}
+                if output_format is not None:
+                    options.setdefault('output_format', output_format)
+                spec = parse_options(options, item.get('portrait'))
+            except (ValueError, KeyError, TypeError) as e:
+                result = {'line': line_number, 'output': name, 'status': 'error', 'error': f'{type(e).__name__}: {e}'}
+                # The output name is unknown if the item or its id is invalid
+                if name is None:
+                    del result['output']
+                report(result)
+                continue
+
+            # Finished entries are removed, so the index is the number of specifications yielded so far
+            submitted[submitted_count] = (line_number, name)
+            submitted_count += 1
+            yield spec
+
+    for batch_result in render_batch(get_specs(), max_workers, max_in_flight, render_function=render_timed_spec):
+        line_number, name = submitted.pop(batch_result.index)
+        if not batch_result.ok:
+            report({'line': line_number, 'output': name, 'status': 'error',
+                    'error': f'{type(batch_result.error).__name__}: {batch_result.error}'})
+            continue
+
+        poster, render_ms, stages_ms = batch_result.result
+        write_start = time.perf_counter()
+        writer.write(name, poster)
+
+        report({'line': line_number, 'output': name, 'status': 'ok', 'bytes': len(poster),
+                'render_ms': round(render_ms, 2), 'write_ms': round((time.perf_counter() - write_start) * 1000, 2),
+                'stages_ms': {stage: round(duration, 2) for stage, duration in stages_ms.items()}})
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='wantedposter',
+                                     description='Generate wanted posters in bulk from JSONL or CSV items')
+    parser.add_argument('input', nargs='?', default='-', help='The input file, or - for stdin (default)')
+    parser.add_argument('--input-format', choices=['jsonl', 'csv'], default=None,
+                        help='The input format. If not given, csv for .csv files and jsonl otherwise')
+    output_group = parser.add_mutually_exclusive_group(required=True)
+    output_group.add_argument('--output-dir', help='Write the posters to a directory')
+    output_group.add_argument('--output-tar', help='Write the posters to a tar file, or - for stdout')
+    output_group.add_argument('--output-zip', help='Write the posters to a zip file, or - for stdout')
+    parser.add_argument('--output-format', default=None, help='The default image format (e.g. JPEG, PNG, WEBP)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip the items whose poster already exists. Only with --output-dir')
+    parser.add_argument('--workers', type=int, default=None, help='The number of worker processes')
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help='The maximum number of posters being rendered at once')
+    args = parser.parse_args()
+
+    if args.resume and args.output_dir is None:
+        parser.error('--resume requires --output-dir')
+
+    input_format = args.input_format
+    if input_format is None:
+        input_format = 'csv' if args.input.lower().endswith('.csv') else 'jsonl'
+
+    archive_path = args.output_tar or args.output_zip
+    results_file = sys.stderr if archive_path == '-' else sys.stdout
+
+    def emit(result: dict) -> None:
+        results_file.write(json.dumps(result) + '\n')
+        results_file.flush()
+
+    input_file = sys.stdin if args.input == '-' else open(args.input, newline='', encoding='utf-8')
+    archive_file = None
+    try:
+        if args.output_dir is not None:
+            writer = DirectoryWriter(args.output_dir)
+        else:
+            archive_file = sys.stdout.buffer if archive_path == '-' else open(archive_path, 'wb')
+            writer = TarWriter(archive_file) if args.output_tar is not None else ZipWriter(archive_file)
+
+        try:
+            counts = generate_posters(read_items(input_file, input_format), writer, emit, args.output_format,
+                                      args.resume, args.workers, args.max_in_flight)
+        finally:
+            writer.close()
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if archive_file is not None and archive_file is not sys.stdout.buffer:
+            archive_file.close()
+
+    print(f'{counts["ok"]} generated, {counts["skipped"]} skipped, {counts["error"]} failed', file=sys.stderr)
+    sys.exit(1 if counts['error'] > 0 else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+from io import BytesIO
+from typing import Union, Tuple, Iterable
+
+from PIL import Image
+
+from .instrumentation import RenderHooks, RenderStage, stage_event
+from .overlays import OverlayLayer
+from .wantedposter import (WantedPoster, HorizontalAlignment, VerticalAlignment, CaptureCondition, Effect, Stamp,
+                           OutputType, OutputSpec, ASSET_REGISTRY, OVERLAY_SHEET, CAPTURE_CONDITION_IMAGE_PATHS,
+                           BOUNTY_POSTER_NAME_OPTIMAL_MAX_LENGTH, BOUNTY_POSTER_COMPONENT_NAME,
+                           BOUNTY_POSTER_COMPONENT_BELLY, BOUNTY_POSTER_NAME_START_Y, BOUNTY_POSTER_BELLY_START_Y,
+                           BOUNTY_POSTER_CAPTURE_CONDITION_START_X, BOUNTY_POSTER_CAPTURE_CONDITION_START_Y,
+                           BOUNTY_POSTER_CAPTURE_CONDITION_DEAD_OR_ALIVE_PATH)
+
+Box = Tuple[int, int, int, int]
+
+
+class PosterDocument:
+    def __init__(self, wanted_poster: WantedPoster,
+                 portrait_horizontal_align: HorizontalAlignment = HorizontalAlignment.CENTER,
+                 portrait_vertical_align: VerticalAlignment = VerticalAlignment.CENTER,
+                 should_make_portrait_transparent: bool = False,
+                 portrait_transparency_value: int = 200,
+                 full_name_max_length: Union[int, None] = BOUNTY_POSTER_NAME_OPTIMAL_MAX_LENGTH,
+                 use_space_sub: bool = True,
+                 capture_condition: CaptureCondition = CaptureCondition.DEAD_OR_ALIVE,
+                 effects: list[Effect] = None, stamp: Stamp = None,
+                 hooks: RenderHooks = None) -> None:
+        """
+        Creates a poster that is kept in memory with its layers, so that updating the bounty, name, capture
+        condition, stamp or effects only re-composites the area of the poster they cover.
+        The arguments are the same as WantedPoster.generate, and the result is identical
+        :param wanted_poster: The Wanted Poster object, its portrait is read once
+        :param portrait_horizontal_align: The horizontal alignment of the portrait image
+        :param portrait_vertical_align: The vertical alignment of the portrait image
+        :param should_make_portrait_transparent: Whether to make the portrait semi-transparent
+        :param portrait_transparency_value: The transparency value of the portrait (0-255). Higher = less transparent
+        :param full_name_max_length: The maximum length of the full name. If None, no limit
+        :param use_space_sub: Whether to use the space substitution character (•) if the name is too long or D. in name
+        :param capture_condition: The capture condition to display on the poster
+        :param effects: The effects to apply to the poster
+        :param stamp: The stamp to apply to the poster
+        :param hooks: The hooks that receive the start and end events of each rendering stage
+        :return: None
+        """
+
+        self.wanted_poster: WantedPoster = wanted_poster
+        self.full_name_max_length: Union[int, None] = full_name_max_length
+        self.use_space_sub: bool = use_space_sub
+        self.capture_condition: CaptureCondition = capture_condition
+        self.effects: list[Effect] = list(effects) if effects is not None else []
+        self.stamp: Union[Stamp, None] = stamp
+        self.hooks: Union[RenderHooks, None] = hooks
+
+        # The base layer is shared with BASE_LAYER_CACHE until the capture condition changes
+        with stage_event(hooks, RenderStage.BASE_LAYER) as event:
+            self._base_layer: Image.Image = wanted_poster._get_base_layer(
+                portrait_horizontal_align, portrait_vertical_align, should_make_portrait_transparent,
+                portrait_transparency_value, capture_condition, hooks)
+            event.size = self._base_layer.size
+        self._is_base_layer_shared: bool = True
+
+        self._name_component: Image.Image = self.__get_name_component()
+        self._belly_component: Image.Image = self.__get_belly_component()
+        self._overlay_layer: Union[OverlayLayer, None] = self.__get_overlay_layer()
+
+        self.image: Image.Image = self._base_layer.copy()
+        self.__recompose((0, 0) + self.image.size)
+
+    def set_bounty(self, bounty: int) -> None:
+        """
+        Updates the bounty, re-compositing only the belly area
+        :param bounty: The bounty of the user
+        :return: None
+        """
+
+        if bounty == self.wanted_poster.bounty:
+            return
+
+        self.wanted_poster.bounty = bounty
+        self._belly_component = self.__get_belly_component()
+        self.__recompose(self.__get_component_box(self._belly_component, BOUNTY_POSTER_BELLY_START_Y))
+
+    def set_name(self, first_name: str = '', last_name: str = '') -> None:
+        """
+        Updates the name, re-compositing only the name area
+        :param first_name: The first name of the user
+        :param last_name: The last name of the user
+        :return: None
+        """
+
+        self.wanted_poster.first_name = first_name if first_name is not None else ''
+        self.wanted_poster.last_name = last_name if last_name is not None else ''
+        self._name_component = self.__get_name_component()
+        self.__recompose(self.__get_component_box(self._name_component, BOUNTY_POSTER_NAME_START_Y))
+
+    def set_capture_condition(self, capture_condition: CaptureCondition) -> None:
+        """
+        Updates the capture condition, re-compositing only the capture condition area
+        :param capture_condition: The capture condition to display on the poster
+        :return: None
+        """
+
+        if capture_condition is self.capture_condition:
+            return
+
+        self.capture_condition = capture_condition
+
+        # The capture condition is the top of the base layer, so it is replaced in place
+        if self._is_base_layer_shared:
+            self._base_layer = self._base_layer.copy()
+            self._is_base_layer_shared = False
+
+        capture_condition_image = ASSET_REGISTRY.get_image(CAPTURE_CONDITION_IMAGE_PATHS.get(
+            capture_condition, BOUNTY_POSTER_CAPTURE_CONDITION_DEAD_OR_ALIVE_PATH), copy=False)
+        self._base_layer.paste(capture_condition_image, (BOUNTY_POSTER_CAPTURE_CONDITION_START_X,
+                                                         BOUNTY_POSTER_CAPTURE_CONDITION_START_Y))
+
+        self.__recompose((BOUNTY_POSTER_CAPTURE_CONDITION_START_X, BOUNTY_POSTER_CAPTURE_CONDITION_START_Y,
+                          BOUNTY_POSTER_CAPTURE_CONDITION_START_X + capture_condition_image.width,
+                          BOUNTY_POSTER_CAPTURE_CONDITION_START_Y + capture_condition_image.height))
+
+    def set_stamp(self, stamp: Union[Stamp, None]) -> None:
+        """
+        Updates the stamp, re-compositing only the area of the old and new stamps
+        :param stamp: The stamp to apply to the poster, or None to remove it
+        :return: None
+        """
+
+        if stamp is self.stamp:
+            return
+
+        self.stamp = stamp
+        self.__update_overlays()
+
+    def add_effect(self, effect: Effect) -> None:
+        """
+        Adds an effect to the poster
+        :param effect: The effect
+        :return: None
+        """
+
+        if effect in self.effects:
+            return
+
+        self.effects.append(effect)
+        self.__update_overlays()
+
+    def remove_effect(self, effect: Effect) -> None:
+        """
+        Removes an effect from the poster
+        :param effect: The effect
+        :return: None
+        """
+
+        if effect not in self.effects:
+            return
+
+        self.effects.remove(effect)
+        self.__update_overlays()
+
+    def get_image(self) -> Image.Image:
+        """
+        Gets a copy of the poster image, that is not affected by later updates
+        :return: The poster image
+        """
+
+        return self.image.copy()
+
+    def save(self, output_poster_path: str = None, output_type: OutputType = OutputType.BYTES,
+             output_format: str = None, save_options: dict = None) -> Union[str, bytes, BytesIO, Image.Image]:
+        """
+        Encodes the current poster
+        :param output_poster_path: The path to the output poster. If None, a temporary file will be created.
+                                   Only used if output_type is FILE
+        :param output_type: How to return the poster: saved to a file, encoded in memory or as a PIL Image
+        :param output_format: The image format (e.g. JPEG, PNG, WEBP). If None, it is inferred from the output path,
+                              or JPEG if there is no path
+        :param save_options: Encoder options passed to PIL (e.g. quality, progressive, optimize, subsampling)
+        :return: The path to the poster, the encoded poster or a copy of the poster image, depending on output_type
+        """
+
+        if output_type is OutputType.IMAGE:
+            return self.get_image()
+
+        with stage_event(self.hooks, RenderStage.SAVE) as event:
+            event.size = self.image.size
+            return WantedPoster._save_poster(self.image, output_poster_path, output_type, output_format, save_options)
+
+    def save_outputs(self, outputs: Iterable[OutputSpec]) -> list[Union[str, bytes, BytesIO, Image.Image]]:
+        """
+        Encodes the current poster in several outputs (e.g. full size, web version, thumbnail)
+        :param outputs: The output specifications
+        :return: The outputs, in the same order. Images are not affected by later updates
+        """
+
+        outputs = list(outputs)
+        is_image_output = any(output.output_type is OutputType.IMAGE for output in outputs)
+
+        return WantedPoster._save_outputs(self.get_image() if is_image_output else self.image, outputs, self.hooks)
+
+    def __get_name_component(self) -> Image.Image:
+        """
+        Renders the name component of the current name
+        :return: The name component
+        """
+
+        with stage_event(self.hooks, RenderStage.NAME_COMPONENT) as event:
+            full_name = self.wanted_poster._get_bounty_poster_name(self.full_name_max_length, self.use_space_sub)
+            name_component = WantedPoster._get_bounty_poster_component(full_name, BOUNTY_POSTER_COMPONENT_NAME)
+            event.size = name_component.size
+
+        return name_component
+
+    def __get_belly_component(self) -> Image.Image:
+        """
+        Renders the belly component of the current bounty
+        :return: The belly component
+        """
+
+        with stage_event(self.hooks, RenderStage.BELLY_COMPONENT) as event:
+            belly = self.wanted_poster._get_bounty_poster_belly()
+            belly_component = WantedPoster._get_bounty_poster_component(belly, BOUNTY_POSTER_COMPONENT_BELLY)
+            event.size = belly_component.size
+
+        return belly_component
+
+    def __get_overlay_layer(self) -> Union[OverlayLayer, None]:
+        """
+        Gets the merged layer of the current stamp and effects
+        :return: The layer, or None if there are no overlays
+        """
+
+        return OVERLAY_SHEET.get_layer(([self.stamp] if self.stamp is not None else []) + self.effects)
+
+    def __update_overlays(self) -> None:
+        """
+        Replaces the overlay layer, re-compositing the area covered by the old or the new one
+        :return: None
+        """
+
+        old_overlay_layer = self._overlay_layer
+        with stage_event(self.hooks, RenderStage.OVERLAYS) as event:
+            self._overlay_layer = self.__get_overlay_layer()
+            if self._overlay_layer is not None:
+                event.size = self._overlay_layer.size
+
+        boxes = [layer.get_box() for layer in (old_overlay_layer, self._overlay_layer) if layer is not None]
+        if len(boxes) > 0:
+            self.__recompose((min(box[0] for box in boxes), min(box[1] for box in boxes),
+                              max(box[2] for box in boxes), max(box[3] for box in boxes)))
+
+    @staticmethod
+    def __get_component_box(component: Image.Image, start_y: int) -> Box:
+        """
+        Gets the area of the poster covered by a name or belly component
+        :param component: The component
+        :param start_y: The y coordinate the component is pasted at
+        :return: The (left, upper, right, lower) box
+        """
+
+        return 0, start_y, component.width, start_y + component.height
+
+    def __recompose(self, box: Box) -> None:
+        """
+        Composites the layers again in an area of the poster, in the same order as WantedPoster.generate
+        :param box: The (left, upper, right, lower) area
+        :return: None
+        """
+
+        box = (max(box[0], 0), max(box[1], 0), min(box[2], self.image.width), min(box[3], self.image.height))
+        if box[0] >= box[2] or box[1] >= box[3]:
+            return
+
+        box_x, box_y = box[0], box[1]
+        region = self._base_layer.crop(box)
+
+        for component, start_y in ((self._name_component, BOUNTY_POSTER_NAME_START_Y),
+                                   (self._belly_component, BOUNTY_POSTER_BELLY_START_Y)):
+            component_box = self.__get_component_box(component, start_y)
+            if component_box[1] < box[3] and component_box[3] > box[1]:
+                region.paste(component, (-box_x, start_y - box_y), component)
+
+        if self._overlay_layer is not None:
+            self._overlay_layer.paste(region, box)
+
+        self.image.paste(region, box)
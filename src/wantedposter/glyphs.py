@@ -0,0 +1,93 @@
+import math
+from typing import Dict, Tuple
+
+from PIL import Image
+
+from .assets import AssetRegistry
+
+
+class GlyphCache:
+    def __init__(self, asset_registry: AssetRegistry, font_path: str, font_size: int) -> None:
+        """
+        Creates a cache of the metrics and rasterized glyphs of a font, so that kerned text can be laid out and
+        drawn without rendering each character again.
+        Glyphs are rendered exactly as ImageDraw.text would, so the output is pixel-identical
+        :param asset_registry: The registry the font is loaded from
+        :param font_path: The path to the font file
+        :param font_size: The font size
+        :return: None
+        """
+
+        self.asset_registry: AssetRegistry = asset_registry
+        self.font_path: str = font_path
+        self.font_size: int = font_size
+
+        # Only the advances of single characters are kept, since the set of characters is bounded but the set of texts
+        # is not
+        self._char_lengths: Dict[str, float] = {}
+        # Glyphs are keyed by character and fractional part of the x coordinate, since FreeType renders
+        # sub-pixel offsets differently
+        self._glyphs: Dict[Tuple[str, float], Tuple[Image.Image, Tuple[int, int]]] = {}
+
+    def get_text_length(self, text: str) -> float:
+        """
+        Gets the advance of a text, as ImageDraw.textlength. Only the advances of single characters are cached
+        :param text: The text
+        :return: The text advance, in pixels
+        """
+
+        text_length = self._char_lengths.get(text) if len(text) == 1 else None
+        if text_length is None:
+            font = self.asset_registry.get_font(self.font_path, self.font_size)
+            text_length = font.getlength(text)
+            if len(text) == 1:
+                self._char_lengths[text] = text_length
+
+        return text_length
+
+    def clear(self) -> None:
+        """
+        Removes all the cached advances and glyphs
+        :return: None
+        """
+
+        self._char_lengths.clear()
+        self._glyphs.clear()
+
+    def draw_text(self, image: Image.Image, x: float, y: int, text: str, kern: int = 0) -> float:
+        """
+        Draws text with white ink on a 'L' image, one character at a time, on the baseline of the given point
+        (as ImageDraw.text with anchor 'ls')
+        :param image: The image to draw on
+        :param x: The x coordinate of the first character
+        :param y: The y coordinate of the baseline
+        :param text: The text to draw
+        :param kern: The space to add after each character
+        :return: The x coordinate after the last character (including its kern)
+        """
+
+        for char in text:
+            mask, (offset_x, offset_y) = self.__get_glyph(char, math.modf(x)[0])
+            if mask.width > 0 and mask.height > 0:
+                image.paste(255, (int(x) + offset_x, y + offset_y), mask)
+
+            x += self.get_text_length(char) + kern
+
+        return x
+
+    def __get_glyph(self, char: str, start_x: float) -> Tuple[Image.Image, Tuple[int, int]]:
+        """
+        Gets the rasterized mask of a character
+        :param char: The character
+        :param start_x: The fractional part of the x coordinate the character is drawn at
+        :return: The mask and its offset from the drawing point
+        """
+
+        key = (char, start_x)
+        glyph = self._glyphs.get(key)
+        if glyph is None:
+            font = self.asset_registry.get_font(self.font_path, self.font_size)
+            mask, offset = font.getmask2(char, 'L', anchor='ls', start=(start_x, 0))
+            glyph = self._glyphs[key] = (Image.Image()._new(mask), offset)
+
+        return glyph
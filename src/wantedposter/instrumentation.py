@@ -0,0 +1,179 @@
+import bisect
+import threading
+import time
+from enum import Enum
+from typing import Union, Tuple, Dict
+
+
+class RenderStage(Enum):
+    BASE_LAYER = 'BASE_LAYER'  # Whole base layer, including the cache lookup
+    TEMPLATE_OPEN = 'TEMPLATE_OPEN'
+    PORTRAIT_RESIZE = 'PORTRAIT_RESIZE'  # Portrait decoding and resizing
+    PORTRAIT_ALIGN = 'PORTRAIT_ALIGN'
+    NAME_COMPONENT = 'NAME_COMPONENT'
+    BELLY_COMPONENT = 'BELLY_COMPONENT'
+    OVERLAYS = 'OVERLAYS'  # Stamp and effects, merged into a single layer
+    OUTPUT_RESIZE = 'OUTPUT_RESIZE'  # Downscaling of each additional output size
+    SAVE = 'SAVE'  # Encoding and saving
+
+
+class RenderHooks:
+    """
+    Receives the start and end events of each stage of WantedPoster.generate.
+    Subclass it and override the methods of interest. Hooks may be called from several threads at the same time
+    """
+
+    def on_stage_start(self, stage: RenderStage) -> None:
+        """
+        Called when a stage starts
+        :param stage: The stage
+        :return: None
+        """
+
+        pass
+
+    def on_stage_end(self, stage: RenderStage, duration: float, size: Union[Tuple[int, int], None]) -> None:
+        """
+        Called when a stage ends, also if it failed
+        :param stage: The stage
+        :param duration: The duration of the stage, in seconds
+        :param size: The size of the image produced by the stage, if any
+        :return: None
+        """
+
+        pass
+
+
+class StageEvent:
+    def __init__(self, hooks: RenderHooks, stage: RenderStage) -> None:
+        """
+        Context manager that reports a stage to the hooks
+        :param hooks: The hooks
+        :param stage: The stage
+        :return: None
+        """
+
+        self.hooks: RenderHooks = hooks
+        self.stage: RenderStage = stage
+        # Size of the image produced by the stage, set by the caller inside the block
+        self.size: Union[Tuple[int, int], None] = None
+
+        self._start: float = 0
+
+    def __enter__(self) -> 'StageEvent':
+        self.hooks.on_stage_start(self.stage)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.hooks.on_stage_end(self.stage, time.perf_counter() - self._start, self.size)
+
+
+class _NullStageEvent:
+    """
+    Stage event used when no hooks are attached, it does nothing
+    """
+
+    def __enter__(self) -> '_NullStageEvent':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    @property
+    def size(self) -> None:
+        return None
+
+    @size.setter
+    def size(self, size: Union[Tuple[int, int], None]) -> None:
+        pass
+
+
+NULL_STAGE_EVENT = _NullStageEvent()
+
+
+def stage_event(hooks: Union[RenderHooks, None], stage: RenderStage) -> Union[StageEvent, _NullStageEvent]:
+    """
+    Gets the context manager that reports a stage to the hooks
+    :param hooks: The hooks, or None
+    :param stage: The stage
+    :return: The context manager. If hooks is None, a shared no-op one
+    """
+
+    if hooks is None:
+        return NULL_STAGE_EVENT
+
+    return StageEvent(hooks, stage)
+
+
+# Upper bounds of the histogram buckets, in seconds
+DEFAULT_HISTOGRAM_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                             2.5, 5.0)
+
+
+class HistogramHooks(RenderHooks):
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_HISTOGRAM_BUCKETS) -> None:
+        """
+        Creates hooks that aggregate the stage durations in memory, as histograms that can be exported to a
+        metrics system (e.g. Prometheus)
+        :param buckets: The sorted upper bounds of the histogram buckets, in seconds. An extra +inf bucket is added
+        :return: None
+        """
+
+        self.buckets: Tuple[float, ...] = tuple(buckets)
+
+        self._lock = threading.Lock()
+        self._histograms: Dict[RenderStage, dict] = {}
+
+    def on_stage_end(self, stage: RenderStage, duration: float, size: Union[Tuple[int, int], None]) -> None:
+        """
+        Adds the duration of a stage to its histogram
+        :param stage: The stage
+        :param duration: The duration of the stage, in seconds
+        :param size: The size of the image produced by the stage, if any
+        :return: None
+        """
+
+        bucket_index = bisect.bisect_left(self.buckets, duration)
+
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = {'count': 0, 'sum': 0.0, 'min': duration, 'max': duration,
+                                                       'buckets': [0] * (len(self.buckets) + 1)}
+
+            histogram['count'] += 1
+            histogram['sum'] += duration
+            histogram['min'] = min(histogram['min'], duration)
+            histogram['max'] = max(histogram['max'], duration)
+            histogram['buckets'][bucket_index] += 1
+
+    def snapshot(self) -> Dict[str, dict]:
+        """
+        Gets a copy of the histograms
+        :return: For each stage name, the count, sum, min and max of the durations (in seconds) and the cumulative
+                 count of each bucket, keyed by its upper bound ('+Inf' for the last one)
+        """
+
+        with self._lock:
+            snapshot = {}
+            for stage, histogram in self._histograms.items():
+                cumulative_count = 0
+                buckets = {}
+                for upper_bound, count in zip(self.buckets + (float('inf'),), histogram['buckets']):
+                    cumulative_count += count
+                    buckets['+Inf' if upper_bound == float('inf') else str(upper_bound)] = cumulative_count
+
+                snapshot[stage.value] = {'count': histogram['count'], 'sum': histogram['sum'],
+                                         'min': histogram['min'], 'max': histogram['max'], 'buckets': buckets}
+
+            return snapshot
+
+    def reset(self) -> None:
+        """
+        Clears the histograms
+        :return: None
+        """
+
+        with self._lock:
+            self._histograms.clear()
@@ -0,0 +1,160 @@
+import threading
+from collections import OrderedDict
+from typing import Iterable, Tuple
+
+from PIL import Image
+
+from .glyphs import GlyphCache
+
+
+class TextLayout:
+    def __init__(self, text: str, text_length: float, x: float, kern: int, canvas_width: int) -> None:
+        """
+        Creates the fitted layout of a line of text in a component of the poster
+        :param text: The text
+        :param text_length: The advance of the text without kerning, in pixels
+        :param x: The x coordinate of the first character on the canvas
+        :param kern: The space added after each character
+        :param canvas_width: The width of the canvas the text is drawn on. If wider than the component, the canvas is
+                             scaled down to the component width
+        :return: None
+        """
+
+        self.text: str = text
+        self.text_length: float = text_length
+        self.x: float = x
+        self.kern: int = kern
+        self.canvas_width: int = canvas_width
+
+
+class TextLayoutEngine:
+    def __init__(self, glyph_cache: GlyphCache, max_width: int, max_kern: int, start_x: int, baseline_y: int,
+                 max_entries: int) -> None:
+        """
+        Creates a thread-safe engine that fits texts in a component of the poster from the cached glyph metrics,
+        without rendering them, and keeps the fitted layouts of the most recently used texts.
+        Texts narrower than the maximum width are kerned to fill it, wider texts are drawn on a wider canvas that is
+        scaled down to the component width
+        :param glyph_cache: The metrics and rasterized glyphs of the font
+        :param max_width: The width the text is fitted in
+        :param max_kern: The maximum space added after each character
+        :param start_x: The x coordinate the kerned text starts at
+        :param baseline_y: The y coordinate of the baseline
+        :param max_entries: The maximum number of layouts kept
+        :return: None
+        """
+
+        self.glyph_cache: GlyphCache = glyph_cache
+        self.max_width: int = max_width
+        self.max_kern: int = max_kern
+        self.start_x: int = start_x
+        self.baseline_y: int = baseline_y
+        self.max_entries: int = max_entries
+
+        self._lock = threading.Lock()
+        self._layouts: OrderedDict[Tuple[str, int], TextLayout] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._layouts)
+
+    def get_layout(self, text: str, width: int) -> TextLayout:
+        """
+        Gets the fitted layout of a text, computing it on first access
+        :param text: The text
+        :param width: The width of the component
+        :return: The layout
+        """
+
+        key = (text, width)
+        with self._lock:
+            layout = self._layouts.get(key)
+            if layout is not None:
+                self._layouts.move_to_end(key)
+                return layout
+
+        layout = self.__fit(text, width)
+
+        with self._lock:
+            self._layouts[key] = layout
+            while len(self._layouts) > self.max_entries:
+                self._layouts.popitem(last=False)
+
+        return layout
+
+    def prefit(self, texts: Iterable[str], width: int) -> list[TextLayout]:
+        """
+        Fits many texts ahead of time (e.g. the names of all the users), so that rendering them does not pay the fitting
+        :param texts: The texts
+        :param width: The width of the component
+        :return: The layouts, in the same order
+        """
+
+        return [self.get_layout(text, width) for text in texts]
+
+    def clear(self) -> None:
+        """
+        Removes all the kept layouts
+        :return: None
+        """
+
+        with self._lock:
+            self._layouts.clear()
+
+    def draw(self, layout: TextLayout, size: Tuple[int, int]) -> Image.Image:
+        """
+        Draws a fitted text with white ink on a new 'L' image
+        :param layout: The layout of the text
+        :param size: The size of the component
+        :return: The text cutout
+        """
+
+        width, height = size
+        if layout.canvas_width == width:
+            alpha = Image.new('L', size)
+            self.glyph_cache.draw_text(alpha, layout.x, self.baseline_y, layout.text, layout.kern)
+            return alpha
+
+        canvas = Image.new('L', (layout.canvas_width, height))
+        self.glyph_cache.draw_text(canvas, layout.x, self.baseline_y, layout.text, layout.kern)
+
+        # Only the rows with ink are scaled down. Their height is unchanged, so the result is the same as scaling
+        # the whole canvas
+        alpha = Image.new('L', size)
+        bbox = canvas.getbbox()
+        if bbox is not None:
+            ink_rows = canvas.crop((0, bbox[1], layout.canvas_width, bbox[3]))
+            alpha.paste(ink_rows.resize((width, ink_rows.height)), (0, bbox[1]))
+
+        return alpha
+
+    def __fit(self, text: str, width: int) -> TextLayout:
+        """
+        Fits a text in the component
+        :param text: The text
+        :param width: The width of the component
+        :return: The layout
+        """
+
+        text_length = self.glyph_cache.get_text_length(text)
+
+        if text_length >= self.max_width:
+            # Centered on a canvas as much wider than the component as the text is wider than the maximum width,
+            # at the position ImageDraw.text would draw it with anchor 'ms' (half the length is rounded in the 26.6
+            # fixed point format of FreeType)
+            canvas_width = int((text_length * width) / self.max_width) if text_length > self.max_width else width
+            half_text_length = (round(text_length * 64) // 2 + 32) >> 6
+            return TextLayout(text, text_length, int(canvas_width / 2) - half_text_length, 0, canvas_width)
+
+        x = self.start_x
+        width_difference = self.max_width - text_length
+        try:
+            kern = int(width_difference / (len(text) - 1))
+        except ZeroDivisionError:
+            kern = int(width_difference / (len(text)))
+
+        # Avoid too much kerning
+        if kern > self.max_kern:
+            kern = self.max_kern
+            x += int((self.max_width / 2) - ((text_length + (kern * (len(text) - 1))) / 2))
+
+        return TextLayout(text, text_length, x, kern, width)
@@ -0,0 +1,199 @@
+import threading
+from collections import OrderedDict
+from typing import Union, Tuple, Dict, Hashable, Iterable
+
+from PIL import Image
+
+from .assets import AssetRegistry
+
+OVERLAY_TILE_SIZE = 64
+OVERLAY_MAX_COMBINATIONS = 4
+
+
+class OverlayLayer:
+    def __init__(self, image: Image.Image, position: Tuple[int, int], tile_size: int = OVERLAY_TILE_SIZE) -> None:
+        """
+        Creates an overlay layer from a RGBA image.
+        The image is split into tiles and only the non-transparent part of each tile is kept, so pasting the layer
+        only touches the pixels it actually covers. Fully opaque tiles are pasted without mask
+        :param image: The RGBA overlay image
+        :param position: The position of the image on the poster
+        :param tile_size: The size of the tiles
+        :return: None
+        """
+
+        self.position: Tuple[int, int] = position
+        self.size: Tuple[int, int] = image.size
+        # (tile image, position on the poster, whether to use the tile as mask)
+        self.tiles: list[Tuple[Image.Image, Tuple[int, int], bool]] = []
+
+        image_w, image_h = image.size
+        for tile_y in range(0, image_h, tile_size):
+            for tile_x in range(0, image_w, tile_size):
+                tile = image.crop((tile_x, tile_y, min(tile_x + tile_size, image_w), min(tile_y + tile_size, image_h)))
+                tile_alpha = tile.getchannel('A')
+
+                # Skip fully transparent tiles, and crop the others to their non-transparent part
+                bbox = tile_alpha.getbbox()
+                if bbox is None:
+                    continue
+                tile = tile.crop(bbox)
+
+                is_opaque = tile.getchannel('A').getextrema() == (255, 255)
+                self.tiles.append((tile.convert('RGB') if is_opaque else tile,
+                                   (position[0] + tile_x + bbox[0], position[1] + tile_y + bbox[1]),
+                                   not is_opaque))
+
+    def get_box(self) -> Tuple[int, int, int, int]:
+        """
+        Gets the area of the poster covered by the layer
+        :return: The (left, upper, right, lower) box
+        """
+
+        return (self.position[0], self.position[1], self.position[0] + self.size[0],
+                self.position[1] + self.size[1])
+
+    def paste(self, image: Image.Image, box: Tuple[int, int, int, int] = None) -> None:
+        """
+        Pastes the layer onto an image
+        :param image: The image
+        :param box: The area of the poster the image covers. If None, the image is the whole poster.
+                    Only the tiles intersecting the area are pasted
+        :return: None
+        """
+
+        if box is None:
+            for tile, position, use_mask in self.tiles:
+                image.paste(tile, position, tile if use_mask else None)
+            return
+
+        box_x, box_y, box_end_x, box_end_y = box
+        for tile, (tile_x, tile_y), use_mask in self.tiles:
+            if (tile_x >= box_end_x or tile_y >= box_end_y
+                    or tile_x + tile.width <= box_x or tile_y + tile.height <= box_y):
+                continue
+
+            image.paste(tile, (tile_x - box_x, tile_y - box_y), tile if use_mask else None)
+
+
+class OverlaySheet:
+    def __init__(self, asset_registry: AssetRegistry, overlays: Dict[Hashable, Tuple[str, Tuple[int, int]]],
+                 tile_size: int = OVERLAY_TILE_SIZE, max_combinations: int = OVERLAY_MAX_COMBINATIONS) -> None:
+        """
+        Creates a sheet of pre-rendered overlay layers (stamps, effects), and of their combinations merged into a
+        single layer, so that applying any number of overlays costs a single tiled paste.
+        The layers of each overlay and of the pre-rendered combinations are kept, only the most recently used of the
+        other combinations are, so that arbitrary combinations cannot grow the sheet without bound
+        :param asset_registry: The registry the overlay images are loaded from
+        :param overlays: For each overlay key, the path to its RGBA image and its position on the poster
+        :param tile_size: The size of the tiles of the layers
+        :param max_combinations: The maximum number of layers kept for combinations that were not pre-rendered
+        :return: None
+        """
+
+        self.asset_registry: AssetRegistry = asset_registry
+        self.overlays: Dict[Hashable, Tuple[str, Tuple[int, int]]] = overlays
+        self.tile_size: int = tile_size
+        self.max_combinations: int = max_combinations
+
+        self._lock = threading.Lock()
+        self._layers: Dict[Tuple[Hashable, ...], OverlayLayer] = {}
+        self._combinations: OrderedDict[Tuple[Hashable, ...], OverlayLayer] = OrderedDict()
+
+    def get_layer(self, keys: Iterable[Hashable]) -> Union[OverlayLayer, None]:
+        """
+        Gets the layer of a combination of overlays. Repeated overlays are applied once
+        :param keys: The keys of the overlays, in the order they are applied
+        :return: The layer, or None if there are no overlays
+        """
+
+        keys = tuple(dict.fromkeys(keys))
+        if len(keys) == 0:
+            return None
+
+        layer = self._layers.get(keys)
+        if layer is not None:
+            return layer
+
+        if len(keys) == 1:
+            return self.__keep_layer(keys)
+
+        with self._lock:
+            layer = self._combinations.get(keys)
+            if layer is not None:
+                self._combinations.move_to_end(keys)
+                return layer
+
+        layer = self.__create_layer(keys)
+
+        with self._lock:
+            self._combinations[keys] = layer
+            while len(self._combinations) > self.max_combinations:
+                self._combinations.popitem(last=False)
+
+        return layer
+
+    def precompute(self, combinations: Iterable[Iterable[Hashable]] = None) -> None:
+        """
+        Pre-renders layers, so that the first posters using them do not pay the cost
+        :param combinations: The combinations of overlay keys to pre-render and keep. If None, each overlay on its own
+        :return: None
+        """
+
+        if combinations is None:
+            combinations = [(key,) for key in self.overlays]
+
+        for keys in combinations:
+            keys = tuple(dict.fromkeys(keys))
+            if len(keys) > 0:
+                self.__keep_layer(keys)
+
+    def clear(self) -> None:
+        """
+        Drops all the pre-rendered layers
+        :return: None
+        """
+
+        with self._lock:
+            self._layers.clear()
+            self._combinations.clear()
+
+    def __keep_layer(self, keys: Tuple[Hashable, ...]) -> OverlayLayer:
+        """
+        Gets the kept layer of an overlay or pre-rendered combination, creating and keeping it if missing
+        :param keys: The de-duplicated keys of the overlays, in the order they are applied
+        :return: The layer
+        """
+
+        with self._lock:
+            layer = self._layers.get(keys)
+            if layer is None:
+                layer = self._layers[keys] = self._combinations.pop(keys, None) or self.__create_layer(keys)
+
+        return layer
+
+    def __create_layer(self, keys: Tuple[Hashable, ...]) -> OverlayLayer:
+        """
+        Creates the layer of a combination of overlays
+        :param keys: The keys of the overlays, in the order they are applied
+        :return: The layer
+        """
+
+        images = [(self.asset_registry.get_image(self.overlays[key][0], 'RGBA', copy=False), self.overlays[key][1])
+                  for key in keys]
+
+        if len(images) == 1:
+            image, position = images[0]
+            return OverlayLayer(image, position, self.tile_size)
+
+        # Merge the overlays on a canvas covering all of them
+        start_x = min(position[0] for _, position in images)
+        start_y = min(position[1] for _, position in images)
+        end_x = max(position[0] + image.width for image, position in images)
+        end_y = max(position[1] + image.height for image, position in images)
+
+        merged_image = Image.new('RGBA', (end_x - start_x, end_y - start_y))
+        for image, position in images:
+            merged_image.alpha_composite(image, (position[0] - start_x, position[1] - start_y))
+
+        return OverlayLayer(merged_image, (start_x, start_y), self.tile_size)
@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Union, Any
+
+POSTER_CACHE_EVICT_EVERY = 100
+POSTER_CACHE_EVICT_INTERVAL = 300
+
+
+class PosterCache:
+    def __init__(self, directory: str, max_bytes: int = None, max_age: float = None,
+                 evict_every: int = POSTER_CACHE_EVICT_EVERY, evict_interval: float = POSTER_CACHE_EVICT_INTERVAL
+                 ) -> None:
+        """
+        Creates a persistent, content-addressed cache of encoded posters.
+        Posters are stored under a hash of everything that affects their content, so the same poster always gets the
+        same file name. Writes are atomic, so the directory can be shared by several processes
+        :param directory: The cache directory, created if it does not exist
+        :param max_bytes: The maximum total size of the cached posters. If None, no limit
+        :param max_age: The maximum time in seconds since a poster was last used. If None, no limit.
+                        Expired posters are never returned, even before they are evicted
+        :param evict_every: Run the eviction every this many stored posters
+        :param evict_interval: Also run the eviction if this many seconds passed since the last one, on any access
+        :return: None
+        """
+
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes
+        self.max_age: float = max_age
+        self.evict_every: int = evict_every
+        self.evict_interval: float = evict_interval
+
+        self.hits: int = 0
+        self.misses: int = 0
+
+        self._lock = threading.Lock()
+        self._puts_since_eviction: int = 0
+        self._last_eviction: float = time.monotonic()
+
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def get_key(*parts: Any) -> str:
+        """
+        Gets the key of a poster
+        :param parts: Everything that affects the poster content. Bytes are hashed as they are, everything else
+                      as canonical JSON
+        :return: The key
+        """
+
+        key_hash = hashlib.blake2b(digest_size=20)
+        for part in parts:
+            if not isinstance(part, bytes):
+                part = json.dumps(part, sort_keys=True, default=str).encode()
+            # Prefix each part with its length, so that different splits of the same bytes get different keys
+            key_hash.update(len(part).to_bytes(8, 'little'))
+            key_hash.update(part)
+
+        return key_hash.hexdigest()
+
+    def get_path(self, key: str, extension: str) -> str:
+        """
+        Gets the path a poster is stored at
+        :param key: The key of the poster
+        :param extension: The file extension
+        :return: The path
+        """
+
+        # Spread the files over subdirectories, to keep directories small
+        return os.path.join(self.directory, key[:2], f'{key}.{extension}')
+
+    def get(self, key: str, extension: str) -> Union[str, None]:
+        """
+        Gets the path of a cached poster
+        :param key: The key of the poster
+        :param extension: The file extension
+        :return: The path, or None if the poster is not cached
+        """
+
+        path = self.__find(key, extension)
+        self.__count(path is not None)
+        self.__evict_if_due()
+
+        return path
+
+    def read(self, key: str, extension: str) -> Union[bytes, None]:
+        """
+        Gets the content of a cached poster
+        :param key: The key of the poster
+        :param extension: The file extension
+        :return: The encoded poster, or None if the poster is not cached
+        """
+
+        data = None
+        path = self.__find(key, extension)
+        if path is not None:
+            try:
+                with open(path, 'rb') as cached_file:
+                    data = cached_file.read()
+            except FileNotFoundError:  # Evicted by another process since it was found
+                pass
+
+        self.__count(data is not None)
+        self.__evict_if_due()
+
+        return data
+
+    def put(self, key: str, extension: str, data: bytes) -> str:
+        """
+        Stores a poster
+        :param key: The key of the poster
+        :param extension: The file extension
+        :param data: The encoded poster
+        :return: The path of the cached poster
+        """
+
+        path = self.get_path(key, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file in the same directory and rename it, so readers never see a partial file
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as temporary_file:
+                temporary_file.write(data)
+            os.replace(temporary_path, path)
+        except BaseException:
+            try:
+                os.remove(temporary_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        with self._lock:
+            self._puts_since_eviction += 1
+            should_evict = self._puts_since_eviction >= self.evict_every
+
+        if should_evict:
+            self.evict()
+        else:
+            self.__evict_if_due()
+
+        return path
+
+    def evict(self) -> int:
+        """
+        Removes the posters older than max_age, then the least recently used ones until the cache is under max_bytes.
+        Files removed concurrently by other processes are ignored
+        :return: The number of removed posters
+        """
+
+        with self._lock:
+            self._puts_since_eviction = 0
+            self._last_eviction = time.monotonic()
+
+        if self.max_bytes is None and self.max_age is None:
+            return 0
+
+        now = time.time()
+        entries = []
+        for root, _, file_names in os.walk(self.directory):
+            for file_name in file_names:
+                path = os.path.join(root, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+
+                # Leftovers of interrupted writes
+                if file_name.endswith('.tmp') and now - stat.st_mtime < 3600:
+                    continue
+
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        removed = 0
+        for last_used, size, path in entries:
+            is_expired = self.max_age is not None and now - last_used > self.max_age
+            is_over_budget = self.max_bytes is not None and total_bytes > self.max_bytes
+            if not is_expired and not is_over_budget:
+                # Entries are sorted by last use, so the remaining ones are newer
+                break
+
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+        return removed
+
+    def __find(self, key: str, extension: str) -> Union[str, None]:
+        """
+        Finds a cached poster and marks it as recently used
+        :param key: The key of the poster
+        :param extension: The file extension
+        :return: The path, or None if the poster is not cached or expired
+        """
+
+        path = self.get_path(key, extension)
+        try:
+            if self.max_age is not None and time.time() - os.stat(path).st_mtime > self.max_age:
+                return None
+
+            # Mark as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+
+        return path
+
+    def __count(self, is_hit: bool) -> None:
+        """
+        Counts a lookup
+        :param is_hit: Whether the poster was found
+        :return: None
+        """
+
+        with self._lock:
+            if is_hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def __evict_if_due(self) -> None:
+        """
+        Runs the eviction if evict_interval passed since the last one, so that a cache that is mostly read is
+        evicted too
+        :return: None
+        """
+
+        with self._lock:
+            is_due = time.monotonic() - self._last_eviction >= self.evict_interval
+            if is_due:
+                # Claimed here, so that concurrent lookups do not evict too
+                self._last_eviction = time.monotonic()
+
+        if is_due:
+            self.evict()
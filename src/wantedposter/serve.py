@@ -0,0 +1,257 @@
+"""
+Local HTTP render server.
+
+    python -m wantedposter.serve --port 8080 --workers 4
+
+POST /generate with either a multipart/form-data body, with an optional 'portrait' file field and an 'options' JSON
+field, or a JSON body with the options only. Options are the WantedPoster arguments (first_name, last_name, bounty)
+and the generate arguments, with enums given by name, e.g.:
+
+    {"first_name": "Luffy", "last_name": "Monkey D.", "bounty": 3000000000, "stamp": "WARLORD",
+     "effects": ["FROST"], "output_format": "JPEG", "save_options": {"quality": 90}}
+
+The response body is the encoded poster. GET /health returns the service counters.
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from email import policy
+from email.parser import BytesParser
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Union, Tuple, Dict
+
+from PIL import Image, UnidentifiedImageError
+
+from .batch import parse_options, render_poster_spec
+from .wantedposter import WantedPoster, BOUNTY_POSTER_EXTENSION, preload_assets
+
+SERVE_DEFAULT_HOST = '127.0.0.1'
+SERVE_DEFAULT_PORT = 8080
+SERVE_MAX_REQUEST_BYTES = 20 * 1024 * 1024
+SERVE_RENDER_TIMEOUT = 60
+
+
+class ServiceOverloadedError(Exception):
+    pass
+
+
+class RenderService:
+    def __init__(self, max_workers: int = None, max_queue: int = None) -> None:
+        """
+        Creates a render service: a pool of pre-warmed worker processes that coalesces identical in-flight requests
+        :param max_workers: The number of worker processes. If None, the number of CPUs
+        :param max_queue: The maximum number of distinct renders queued or running. Requests over the limit are
+                          rejected with ServiceOverloadedError. If None, four times the number of workers
+        :return: None
+        """
+
+        self.max_workers: int = max_workers or os.cpu_count() or 1
+        self.max_queue: int = max_queue or self.max_workers * 4
+
+        self.rendered: int = 0
+        self.coalesced: int = 0
+        self.rejected: int = 0
+
+        # Decode the assets before starting the workers, so that forked workers share them with the parent
+        preload_assets()
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=preload_assets)
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+
+    def render(self, options: dict, portrait: Union[bytes, None], timeout: float = SERVE_RENDER_TIMEOUT) -> bytes:
+        """
+        Renders a poster, or waits for an identical render already in progress
+        :param options: The poster options
+        :param portrait: The portrait image content, or None
+        :param timeout: The maximum time to wait for the poster, in seconds
+        :return: The encoded poster
+        """
+
+        spec = parse_options(options, portrait)
+        key = get_request_key(options, portrait)
+
+        is_new = False
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+            else:
+                if len(self._in_flight) >= self.max_queue:
+                    self.rejected += 1
+                    raise ServiceOverloadedError(f'Too many renders in progress ({self.max_queue})')
+
+                future = self._executor.submit(render_poster_spec, spec)
+                self._in_flight[key] = future
+                self.rendered += 1
+                is_new = True
+
+        # Registered without holding the lock: if the render already finished, the callback runs right away
+        if is_new:
+            future.add_done_callback(lambda done_future: self.__remove_in_flight(key, done_future))
+
+        return future.result(timeout)
+
+    def stats(self) -> dict:
+        """
+        Gets the service counters
+        :return: The counters
+        """
+
+        with self._lock:
+            return {'workers': self.max_workers, 'max_queue': self.max_queue, 'in_flight': len(self._in_flight),
+                    'rendered': self.rendered, 'coalesced': self.coalesced, 'rejected': self.rejected}
+
+    def shutdown(self) -> None:
+        """
+        Stops the worker processes
+        :return: None
+        """
+
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __remove_in_flight(self, key: str, future: Future) -> None:
+        """
+        Removes a finished render from the in-flight ones
+        :param key: The request key
+        :param future: The future of the finished render
+        :return: None
+        """
+
+        with self._lock:
+            # A newer render of the same request may have replaced it already
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+
+def get_request_key(options: dict, portrait: Union[bytes, None]) -> str:
+    """
+    Gets the key identifying a request, identical requests have the same key
+    :param options: The poster options
+    :param portrait: The portrait image content, or None
+    :return: The key
+    """
+
+    request_hash = hashlib.blake2b(json.dumps(options, sort_keys=True).encode(), digest_size=16)
+    if portrait is not None:
+        request_hash.update(portrait)
+
+    return request_hash.hexdigest()
+
+
+class RenderHTTPServer(ThreadingHTTPServer):
+    # Let the render queue, not the listen backlog, decide when to shed load
+    request_queue_size = 128
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    service: RenderService = None
+
+    def do_GET(self) -> None:
+        if self.path.rstrip('/') != '/health':
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        self.__send(HTTPStatus.OK, json.dumps(self.service.stats()).encode(), 'application/json')
+
+    def do_POST(self) -> None:
+        if self.path.rstrip('/') not in ('', '/generate'):
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        content_length = int(self.headers.get('Content-Length', 0))
+        if content_length > SERVE_MAX_REQUEST_BYTES:
+            self.send_error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+            return
+
+        try:
+            options, portrait = self.__parse_body(self.rfile.read(content_length))
+            # Resolved once, so that the poster is encoded in the format of the Content-Type
+            image_format = WantedPoster.get_image_format(options.get('output_format') or None,
+                                                         BOUNTY_POSTER_EXTENSION)
+            poster = self.service.render(dict(options, output_format=image_format), portrait)
+        except ServiceOverloadedError as e:
+            self.send_error(HTTPStatus.SERVICE_UNAVAILABLE, str(e))
+            return
+        except (ValueError, KeyError, TypeError, UnidentifiedImageError) as e:
+            self.send_error(HTTPStatus.BAD_REQUEST, str(e))
+            return
+        except FutureTimeoutError:
+            self.send_error(HTTPStatus.GATEWAY_TIMEOUT)
+            return
+        except Exception as e:
+            self.send_error(HTTPStatus.INTERNAL_SERVER_ERROR, str(e))
+            return
+
+        self.__send(HTTPStatus.OK, poster, Image.MIME.get(image_format, 'application/octet-stream'))
+
+    def __parse_body(self, body: bytes) -> Tuple[dict, Union[bytes, None]]:
+        """
+        Parses the request body
+        :param body: The request body
+        :return: The poster options and the portrait image content, if any
+        """
+
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('application/json'):
+            return json.loads(body or b'{}'), None
+
+        if not content_type.startswith('multipart/form-data'):
+            raise ValueError('Content-Type must be multipart/form-data or application/json')
+
+        message = BytesParser(policy=policy.HTTP).parsebytes(
+            f'Content-Type: {content_type}\r\n\r\n'.encode() + body)
+
+        options, portrait = {}, None
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if name == 'options':
+                options = json.loads(part.get_payload(decode=True) or b'{}')
+            elif name == 'portrait':
+                portrait = part.get_payload(decode=True)
+
+        return options, portrait
+
+    def __send(self, status: HTTPStatus, body: bytes, content_type: str) -> None:
+        """
+        Sends a response
+        :param status: The response status
+        :param body: The response body
+        :param content_type: The response content type
+        :return: None
+        """
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve wanted poster rendering over HTTP')
+    parser.add_argument('--host', default=SERVE_DEFAULT_HOST, help='The address to listen on')
+    parser.add_argument('--port', type=int, default=SERVE_DEFAULT_PORT, help='The port to listen on')
+    parser.add_argument('--workers', type=int, default=None, help='The number of worker processes')
+    parser.add_argument('--max-queue', type=int, default=None,
+                        help='The maximum number of renders in progress, over which requests get a 503')
+    args = parser.parse_args()
+
+    RenderRequestHandler.service = RenderService(args.workers, args.max_queue)
+    server = RenderHTTPServer((args.host, args.port), RenderRequestHandler)
+    print(f'Serving on http://{args.host}:{args.port}')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        RenderRequestHandler.service.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,33 @@
 import os
-import uuid
-from datetime import datetime
 from enum import Enum
-from io import BytesIO
-from typing import Union, Tuple
+from io import BytesIO, UnsupportedOperation
+from typing import Union, Tuple, Iterable, Iterator, TYPE_CHECKING
 
-from PIL import Image, ImageFont, ImageDraw
-from unidecode import unidecode
+from PIL import Image
+
+from .assets import AssetRegistry
+from .cache import ImageLRUCache
+from .glyphs import GlyphCache
+from .instrumentation import RenderHooks, RenderStage, stage_event
+from .layout import TextLayout, TextLayoutEngine
+from .overlays import OverlaySheet
+
+if TYPE_CHECKING:
+    from .batch import PosterSpec, BatchResult
+    from .poster_cache import PosterCache
 
 ROOT_DIR = os.path.dirname(__file__)
 BOUNTY_POSTER_EXTENSION = 'jpg'
 BOUNTY_POSTER_ASSETS_PATH = os.path.join(ROOT_DIR, 'assets')
+BOUNTY_POSTER_ASSET_BUNDLE_PATH = os.path.join(BOUNTY_POSTER_ASSETS_PATH, 'assets.bundle')
 BOUNTY_POSTER_TEMPLATE_PATH = os.path.join(BOUNTY_POSTER_ASSETS_PATH, 'image_components', 'template.png')
 BOUNTY_POSTER_NO_PHOTO_PATH = os.path.join(BOUNTY_POSTER_ASSETS_PATH, 'image_components', 'no_portrait.jpg')
 BOUNTY_POSTER_PORTRAIT_BOX_START_Y = 238
 BOUNTY_POSTER_PORTRAIT_BOX_H = 464
 BOUNTY_POSTER_PORTRAIT_BOX_START_X = 73
 BOUNTY_POSTER_PORTRAIT_BOX_W = 640
+BOUNTY_POSTER_PORTRAIT_MAX_PIXELS = 50_000_000
+BOUNTY_POSTER_PORTRAIT_REDUCING_GAP = 3.0
 BOUNTY_POSTER_PORTRAIT_TEXTURE_PATH = os.path.join(BOUNTY_POSTER_ASSETS_PATH, 'image_components',
                                                    'texture_portrait.jpg')
 BOUNTY_POSTER_CAPTURE_CONDITION_DEAD_OR_ALIVE_PATH = os.path.join(BOUNTY_POSTER_ASSETS_PATH, 'image_components',
@@ -60,6 +71,9 @@ BOUNTY_POSTER_CAPTURE_CONDITION_START_X = 0
 BOUNTY_POSTER_CAPTURE_CONDITION_START_Y = 724
 BOUNTY_POSTER_STAMP_START_X = 0
 BOUNTY_POSTER_STAMP_START_Y = 100
+BOUNTY_POSTER_BASE_LAYER_CACHE_MAX_BYTES = 64 * 1024 * 1024
+BOUNTY_POSTER_COMPONENT_ALPHA_CACHE_MAX_BYTES = 16 * 1024 * 1024
+BOUNTY_POSTER_TEXT_LAYOUT_MAX_ENTRIES = 100_000
 
 
 class HorizontalAlignment(Enum):
@@ -91,6 +105,58 @@ class Stamp(Enum):
     FLEE_ON_SIGHT = 'FLEE_ON_SIGHT'
 
 
+class OutputType(Enum):
+    FILE = 'FILE'  # Save to a file and return its path
+    BYTES = 'BYTES'  # Return the encoded image as bytes
+    BYTES_IO = 'BYTES_IO'  # Return the encoded image as a BytesIO object, positioned at the start
+    IMAGE = 'IMAGE'  # Return the PIL Image, without encoding it
+
+
+class OutputSpec:
+    def __init__(self, size: Union[int, Tuple[int, int], None] = None, output_format: str = None,
+                 quality: int = None, save_options: dict = None, output_type: OutputType = OutputType.BYTES,
+                 output_poster_path: str = None, resample: Image.Resampling = Image.Resampling.LANCZOS) -> None:
+        """
+        Creates the specification of one of the outputs of a render, see WantedPoster.generate
+        :param size: The width of the output, the height keeps the poster aspect ratio, or its (width, height).
+                     If None, the full size
+        :param output_format: The image format (e.g. JPEG, PNG, WEBP). If None, it is inferred from the output path,
+                              or JPEG if there is no path
+        :param quality: The encoder quality, shortcut for the quality save option
+        :param save_options: Encoder options passed to PIL (e.g. quality, progressive, optimize, subsampling)
+        :param output_type: How to return the output: saved to a file, encoded in memory or as a PIL Image
+        :param output_poster_path: The path to the output file. If None, a temporary file will be created.
+                                   Only used if output_type is FILE
+        :param resample: The resampling filter used to resize the poster. BILINEAR is about 3 times faster than
+                         LANCZOS, and often good enough for thumbnails
+        :return: None
+        """
+
+        self.size: Union[int, Tuple[int, int], None] = size
+        self.output_format: Union[str, None] = output_format
+        self.save_options: dict = dict(save_options or {})
+        if quality is not None:
+            self.save_options['quality'] = quality
+        self.output_type: OutputType = output_type
+        self.output_poster_path: Union[str, None] = output_poster_path
+        self.resample: Image.Resampling = resample
+
+    def get_size(self, full_size: Tuple[int, int]) -> Tuple[int, int]:
+        """
+        Gets the size of the output
+        :param full_size: The full size of the poster
+        :return: The (width, height) of the output
+        """
+
+        if self.size is None:
+            return full_size
+
+        if isinstance(self.size, int):
+            return self.size, max(round(self.size * full_size[1] / full_size[0]), 1)
+
+        return self.size
+
+
 EFFECT_IMAGE_PATHS = {
     Effect.FROST: BOUNTY_POSTER_EFFECT_FROST_PATH,
     Effect.LIGHTNING: BOUNTY_POSTER_LIGHTNING_EFFECT_PATH
@@ -102,6 +168,113 @@ STAMP_IMAGE_PATHS = {
     Stamp.FLEE_ON_SIGHT: BOUNTY_POSTER_STAMP_FLEE_ON_SIGHT
 }
 
+CAPTURE_CONDITION_IMAGE_PATHS = {
+    CaptureCondition.DEAD_OR_ALIVE: BOUNTY_POSTER_CAPTURE_CONDITION_DEAD_OR_ALIVE_PATH,
+    CaptureCondition.ONLY_DEAD: BOUNTY_POSTER_CAPTURE_CONDITION_ONLY_DEAD_PATH,
+    CaptureCondition.ONLY_ALIVE: BOUNTY_POSTER_CAPTURE_CONDITION_ONLY_ALIVE_PATH
+}
+
+# The static images of the poster, and the mode they are used in
+BOUNTY_POSTER_ASSET_IMAGES = [
+    (BOUNTY_POSTER_TEMPLATE_PATH, 'RGBA'),
+    (BOUNTY_POSTER_NO_PHOTO_PATH, None),
+    (BOUNTY_POSTER_PORTRAIT_TEXTURE_PATH, None),
+    (BOUNTY_POSTER_NAME_TEXTURE_PATH, None),
+    (BOUNTY_POSTER_BELLY_TEXTURE_PATH, None),
+    *[(path, None) for path in CAPTURE_CONDITION_IMAGE_PATHS.values()],
+    *[(path, 'RGBA') for path in EFFECT_IMAGE_PATHS.values()],
+    *[(path, 'RGBA') for path in STAMP_IMAGE_PATHS.values()]
+]
+
+# Shared cache of the decoded static assets, keyed by their path and the mode they are used in
+ASSET_REGISTRY = AssetRegistry(
+    images=BOUNTY_POSTER_ASSET_IMAGES,
+    fonts=[(BOUNTY_POSTER_NAME_FONT_PATH, BOUNTY_POSTER_NAME_FONT_SIZE),
+           (BOUNTY_POSTER_BELLY_FONT_PATH, BOUNTY_POSTER_BELLY_FONT_SIZE)],
+    bundle_path=BOUNTY_POSTER_ASSET_BUNDLE_PATH)
+
+
+# Cache of the composited base layers (portrait, template and capture condition), keyed by portrait content, alignment,
+# transparency and capture condition. Set max_bytes to resize it, or to 0 to disable it
+BASE_LAYER_CACHE = ImageLRUCache(BOUNTY_POSTER_BASE_LAYER_CACHE_MAX_BYTES)
+
+
+# Pre-rendered stamp and effect layers, and their combinations merged into a single layer
+OVERLAY_SHEET = OverlaySheet(
+    ASSET_REGISTRY,
+    {**{stamp: (path, (BOUNTY_POSTER_STAMP_START_X, BOUNTY_POSTER_STAMP_START_Y))
+        for stamp, path in STAMP_IMAGE_PATHS.items()},
+     **{effect: (path, (0, 0)) for effect, path in EFFECT_IMAGE_PATHS.items()}})
+
+# Glyph advances and rasterized glyphs of the name and belly fonts
+GLYPH_CACHES = {
+    BOUNTY_POSTER_COMPONENT_NAME: GlyphCache(ASSET_REGISTRY, BOUNTY_POSTER_NAME_FONT_PATH,
+                                             BOUNTY_POSTER_NAME_FONT_SIZE),
+    BOUNTY_POSTER_COMPONENT_BELLY: GlyphCache(ASSET_REGISTRY, BOUNTY_POSTER_BELLY_FONT_PATH,
+                                              BOUNTY_POSTER_BELLY_FONT_SIZE)
+}
+
+# Fitted layouts (kerning or scaling) of the name and belly texts, computed from the glyph metrics
+TEXT_LAYOUT_ENGINES = {
+    BOUNTY_POSTER_COMPONENT_NAME: TextLayoutEngine(GLYPH_CACHES[BOUNTY_POSTER_COMPONENT_NAME],
+                                                   BOUNTY_POSTER_NAME_MAX_W, BOUNTY_POSTER_NAME_MAX_KERN,
+                                                   BOUNTY_POSTER_NAME_START_X, BOUNTY_POSTER_NAME_H,
+                                                   BOUNTY_POSTER_TEXT_LAYOUT_MAX_ENTRIES),
+    BOUNTY_POSTER_COMPONENT_BELLY: TextLayoutEngine(GLYPH_CACHES[BOUNTY_POSTER_COMPONENT_BELLY],
+                                                    BOUNTY_POSTER_BELLY_MAX_W, BOUNTY_POSTER_BELLY_MAX_KERN,
+                                                    BOUNTY_POSTER_BELLY_START_X, BOUNTY_POSTER_BELLY_H,
+                                                    BOUNTY_POSTER_TEXT_LAYOUT_MAX_ENTRIES)
+}
+
+# Cache of the rendered text cutouts of the name and belly components, keyed by (text, component type)
+COMPONENT_ALPHA_CACHE = ImageLRUCache(BOUNTY_POSTER_COMPONENT_ALPHA_CACHE_MAX_BYTES)
+
+
+def get_library_version() -> str:
+    """
+    Gets the installed version of the library
+    :return: The version, or 'unknown' if the library is not installed (e.g. running from source)
+    """
+
+    # Imported here, it is slow to import and only needed by the poster cache
+    import importlib.metadata
+
+    try:
+        return importlib.metadata.version('one-piece-wanted-poster')
+    except importlib.metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+def preload_assets() -> None:
+    """
+    Decodes all the static poster assets (template, textures, overlays and fonts) ahead of the first render,
+    and pre-renders the layer of each stamp and effect. Use OVERLAY_SHEET.precompute to also pre-merge combinations.
+    Without this call, each asset is lazily decoded on first use
+    :return: None
+    """
+
+    ASSET_REGISTRY.warm_up()
+    OVERLAY_SHEET.precompute()
+
+
+def prefit_names(names: Iterable[Tuple[str, str]],
+                 full_name_max_length: Union[int, None] = BOUNTY_POSTER_NAME_OPTIMAL_MAX_LENGTH,
+                 use_space_sub: bool = True) -> list[TextLayout]:
+    """
+    Fits the names of many users ahead of time (e.g. a whole roster), so that rendering their posters only draws
+    the fitted text. The layouts are kept by the name engine of TEXT_LAYOUT_ENGINES, up to its max_entries
+    :param names: The (first name, last name) pairs
+    :param full_name_max_length: The maximum length of the full name. If None, no limit
+    :param use_space_sub: Whether to use the space substitution character (•) if the name is too long or D. in name
+    :return: The layouts, in the same order. Their text is the name as written on the poster
+    """
+
+    texture_width = ASSET_REGISTRY.get_image(BOUNTY_POSTER_NAME_TEXTURE_PATH, copy=False).width
+    texts = [WantedPoster(None, first_name, last_name)._get_bounty_poster_name(full_name_max_length, use_space_sub)
+             for first_name, last_name in names]
+
+    return TEXT_LAYOUT_ENGINES[BOUNTY_POSTER_COMPONENT_NAME].prefit(texts, texture_width)
+
 
 class WantedPoster:
     def __init__(self, portrait: Union[str, BytesIO] = None, first_name: str = '', last_name: str = '', bounty: int = 0
@@ -120,6 +293,9 @@ class WantedPoster:
         self.last_name: str = last_name if last_name is not None else ''
         self.bounty: int = bounty
 
+        # The portrait content and its digest, read once per poster
+        self.__portrait_data: Union[Tuple[Union[str, BytesIO], bytes, str], None] = None
+
     def generate(self, output_poster_path: str = None,
                  portrait_horizontal_align: HorizontalAlignment = HorizontalAlignment.CENTER,
                  portrait_vertical_align: VerticalAlignment = VerticalAlignment.CENTER,
@@ -128,10 +304,18 @@ class WantedPoster:
                  full_name_max_length: Union[int, None] = BOUNTY_POSTER_NAME_OPTIMAL_MAX_LENGTH,
                  use_space_sub: bool = True,
                  capture_condition: CaptureCondition = CaptureCondition.DEAD_OR_ALIVE,
-                 effects: list[Effect] = None, stamp: Stamp = None) -> str:
+                 effects: list[Effect] = None, stamp: Stamp = None,
+                 output_type: OutputType = OutputType.FILE,
+                 output_format: str = None,
+                 save_options: dict = None,
+                 hooks: RenderHooks = None,
+                 poster_cache: 'PosterCache' = None,
+                 outputs: Iterable[OutputSpec] = None
+                 ) -> Union[str, bytes, BytesIO, Image.Image, list[Union[str, bytes, BytesIO, Image.Image]]]:
         """
-        Generates a wanted poster and saves it to the specified path
-        :param output_poster_path: The path to the output poster. If None, a temporary file will be created
+        Generates a wanted poster and saves it to the specified path, or returns it in memory
+        :param output_poster_path: The path to the output poster. If None, a temporary file will be created.
+                                   Only used if output_type is FILE
         :param portrait_vertical_align: The vertical alignment of the portrait image
         :param portrait_horizontal_align: The horizontal alignment of the portrait image
         :param should_make_portrait_transparent: Whether to make the portrait semi-transparent
@@ -141,51 +325,281 @@ class WantedPoster:
         :param capture_condition: The capture condition to display on the poster
         :param effects: The effects to apply to the poster
         :param stamp: The stamp to apply to the poster
-        :return: The path to the generated poster
+        :param output_type: How to return the poster: saved to a file, encoded in memory or as a PIL Image
+        :param output_format: The image format (e.g. JPEG, PNG, WEBP). If None, it is inferred from the output path,
+                              or JPEG if there is no path
+        :param save_options: Encoder options passed to PIL (e.g. quality, progressive, optimize, subsampling)
+        :param hooks: The hooks that receive the start and end events of each rendering stage
+        :param poster_cache: The persistent cache to get the poster from, or to store it in if not cached.
+                             If output_poster_path is None, the path of the cached file is returned, and it must not be
+                             modified or deleted. Not used if output_type is IMAGE
+        :param outputs: Several outputs (e.g. full size, web version, thumbnail) to produce from the same render.
+                        If set, output_poster_path, output_type, output_format, save_options and poster_cache are
+                        not used
+        :return: The path to the generated poster, the encoded poster or the poster image, depending on output_type.
+                 If outputs is set, the list of the outputs, in the same order
         """
 
-        # If output path is not specified, use current timestamp in "yyyyMMddHHmmss" format + random uuid
-        if output_poster_path is None:
-            output_poster_path = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex}.jpg"
-
         if effects is None:
             effects = []
 
+        if poster_cache is not None and output_type is not OutputType.IMAGE and outputs is None:
+            return self.__generate_cached(poster_cache, output_poster_path, output_type, output_format, save_options,
+                                          dict(portrait_horizontal_align=portrait_horizontal_align,
+                                               portrait_vertical_align=portrait_vertical_align,
+                                               should_make_portrait_transparent=should_make_portrait_transparent,
+                                               portrait_transparency_value=portrait_transparency_value,
+                                               full_name_max_length=full_name_max_length, use_space_sub=use_space_sub,
+                                               capture_condition=capture_condition, effects=effects, stamp=stamp,
+                                               hooks=hooks))
+
+        # Get base layer (portrait, template and capture condition), shared between posters with the same portrait
+        with stage_event(hooks, RenderStage.BASE_LAYER) as event:
+            new_image = self._get_base_layer(portrait_horizontal_align, portrait_vertical_align,
+                                             should_make_portrait_transparent, portrait_transparency_value,
+                                             capture_condition, hooks).copy()
+            event.size = new_image.size
+
+        # Add name component
+        with stage_event(hooks, RenderStage.NAME_COMPONENT) as event:
+            full_name = self._get_bounty_poster_name(full_name_max_length, use_space_sub)
+            name_texture, name_alpha = self._get_bounty_poster_component_layers(full_name,
+                                                                                BOUNTY_POSTER_COMPONENT_NAME)
+            new_image.paste(name_texture, (0, BOUNTY_POSTER_NAME_START_Y), name_alpha)
+            event.size = name_texture.size
+
+        # Add belly component
+        with stage_event(hooks, RenderStage.BELLY_COMPONENT) as event:
+            belly = self._get_bounty_poster_belly()
+            belly_texture, belly_alpha = self._get_bounty_poster_component_layers(belly,
+                                                                                  BOUNTY_POSTER_COMPONENT_BELLY)
+            new_image.paste(belly_texture, (0, BOUNTY_POSTER_BELLY_START_Y), belly_alpha)
+            event.size = belly_texture.size
+
+        # Add stamp and effects, as a single pre-merged layer
+        with stage_event(hooks, RenderStage.OVERLAYS) as event:
+            overlay_layer = OVERLAY_SHEET.get_layer(([stamp] if stamp is not None else []) + effects)
+            if overlay_layer is not None:
+                overlay_layer.paste(new_image)
+                event.size = overlay_layer.size
+
+        if outputs is not None:
+            return self._save_outputs(new_image, outputs, hooks)
+
+        with stage_event(hooks, RenderStage.SAVE) as event:
+            event.size = new_image.size
+            return self._save_poster(new_image, output_poster_path, output_type, output_format, save_options)
+
+    def __generate_cached(self, poster_cache: 'PosterCache', output_poster_path: Union[str, None],
+                          output_type: OutputType, output_format: Union[str, None], save_options: Union[dict, None],
+                          render_kwargs: dict) -> Union[str, bytes, BytesIO]:
+        """
+        Gets a poster from the persistent cache, rendering and storing it if not cached
+        :param poster_cache: The persistent cache
+        :param output_poster_path: The path to the output poster. If None, the path of the cached file is returned
+        :param output_type: How to return the poster
+        :param output_format: The image format
+        :param save_options: Encoder options passed to PIL
+        :param render_kwargs: The other generate arguments
+        :return: The path to the poster or the encoded poster, depending on output_type
+        """
+
+        # Resolve the format, so that e.g. 'jpg' and a '.jpg' output path share the cache entry
+        if output_format is None and output_type is OutputType.FILE and output_poster_path is not None:
+            output_format = os.path.splitext(output_poster_path)[1]
+        image_format = self.get_image_format(output_format or None, BOUNTY_POSTER_EXTENSION)
+        extension = BOUNTY_POSTER_EXTENSION if image_format == 'JPEG' else image_format.lower()
+
+        portrait_data = self.__get_portrait_data()[0] if self.portrait is not None else None
+        cache_key = poster_cache.get_key(
+            get_library_version(), ASSET_REGISTRY.get_version(), portrait_data, self.first_name, self.last_name,
+            self.bounty, image_format, save_options or {},
+            {option: (value.value if isinstance(value, Enum) else value) for option, value in render_kwargs.items()
+             if option != 'hooks'})
+
+        # The content is read at once, since another process may evict the file at any time
+        poster_bytes, cached_path = None, None
+        if output_type is OutputType.FILE and output_poster_path is None:
+            cached_path = poster_cache.get(cache_key, extension)
+        else:
+            poster_bytes = poster_cache.read(cache_key, extension)
+
+        if cached_path is None and poster_bytes is None:
+            poster_bytes = self.generate(output_type=OutputType.BYTES, output_format=image_format,
+                                         save_options=save_options, **render_kwargs)
+            cached_path = poster_cache.put(cache_key, extension, poster_bytes)
+
+        if output_type is OutputType.FILE:
+            if output_poster_path is None:
+                return cached_path
+
+            with open(output_poster_path, 'wb') as output_file:
+                output_file.write(poster_bytes)
+            return output_poster_path
+
+        if output_type is OutputType.BYTES:
+            return poster_bytes
+
+        return BytesIO(poster_bytes)
+
+    @staticmethod
+    def _save_poster(new_image: Image, output_poster_path: Union[str, None], output_type: OutputType,
+                     output_format: Union[str, None], save_options: Union[dict, None]
+                     ) -> Union[str, bytes, BytesIO, Image.Image]:
+        """
+        Saves the poster to a file or encodes it in memory
+        :param new_image: The poster image
+        :param output_poster_path: The path to the output poster. If None, a temporary file will be created
+        :param output_type: How to return the poster
+        :param output_format: The image format. If None, it is inferred from the output path, or JPEG if there is no
+                              path
+        :param save_options: Encoder options passed to PIL
+        :return: The path to the generated poster, the encoded poster or the poster image, depending on output_type
+        """
+
+        if output_type is OutputType.IMAGE:
+            return new_image
+
+        if output_type is OutputType.FILE:
+            # If output path is not specified, use current timestamp in "yyyyMMddHHmmss" format + random uuid
+            if output_poster_path is None:
+                # Imported here, they are slow to import and only needed for generated file names
+                import uuid
+                from datetime import datetime
+
+                extension = BOUNTY_POSTER_EXTENSION if output_format is None else output_format.lower()
+                output_poster_path = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex}.{extension}"
+
+            # Save image
+            save_path = output_poster_path
+            new_image.save(save_path, format=WantedPoster.get_image_format(output_format), **(save_options or {}))
+
+            return save_path
+
+        # Encode image in memory
+        image_bytes = BytesIO()
+        new_image.save(image_bytes, format=WantedPoster.get_image_format(output_format, BOUNTY_POSTER_EXTENSION),
+                       **(save_options or {}))
+
+        if output_type is OutputType.BYTES:
+            return image_bytes.getvalue()
+
+        image_bytes.seek(0)
+        return image_bytes
+
+    @staticmethod
+    def _save_outputs(new_image: Image, outputs: Iterable[OutputSpec], hooks: Union[RenderHooks, None]
+                      ) -> list[Union[str, bytes, BytesIO, Image.Image]]:
+        """
+        Produces several outputs from the same poster image.
+        Downscales are cascaded from the largest output to the smallest, so each one starts from the next larger
+        output instead of the full poster
+        :param new_image: The poster image
+        :param outputs: The output specifications
+        :param hooks: The hooks that receive the stage events, or None
+        :return: The outputs, in the same order as their specifications
+        """
+
+        outputs = list(outputs)
+        results: list[Union[str, bytes, BytesIO, Image.Image, None]] = [None] * len(outputs)
+
+        # Largest outputs first. Upscales are made from the full poster
+        output_sizes = [output.get_size(new_image.size) for output in outputs]
+        output_order = sorted(range(len(outputs)), key=lambda i: output_sizes[i][0] * output_sizes[i][1], reverse=True)
+
+        source_image = new_image
+        for index in output_order:
+            output, output_size = outputs[index], output_sizes[index]
+
+            if output_size == source_image.size:
+                output_image = source_image
+            else:
+                with stage_event(hooks, RenderStage.OUTPUT_RESIZE) as event:
+                    is_downscale = output_size[0] <= source_image.width and output_size[1] <= source_image.height
+                    output_image = (source_image if is_downscale else new_image).resize(output_size, output.resample)
+                    event.size = output_size
+                if is_downscale:
+                    source_image = output_image
+
+            if output.output_type is OutputType.IMAGE:
+                # Images returned more than once are copied, so that the outputs do not share pixels
+                if any(result is output_image for result in results):
+                    output_image = output_image.copy()
+                results[index] = output_image
+                continue
+
+            with stage_event(hooks, RenderStage.SAVE) as event:
+                event.size = output_size
+                results[index] = WantedPoster._save_poster(output_image, output.output_poster_path,
+                                                           output.output_type, output.output_format,
+                                                           output.save_options)
+
+        return results
+
+    def _get_base_layer(self, portrait_horizontal_align: HorizontalAlignment,
+                        portrait_vertical_align: VerticalAlignment, should_make_portrait_transparent: bool,
+                        portrait_transparency_value: int, capture_condition: CaptureCondition,
+                        hooks: Union[RenderHooks, None] = None) -> Image:
+        """
+        Gets the base layer of the poster, everything below the name and belly components:
+        portrait texture, portrait, template and capture condition.
+        The layer is cached in BASE_LAYER_CACHE, so it is shared and must be copied before drawing on it
+        :param portrait_horizontal_align: The horizontal alignment of the portrait image
+        :param portrait_vertical_align: The vertical alignment of the portrait image
+        :param should_make_portrait_transparent: Whether to make the portrait semi-transparent
+        :param portrait_transparency_value: The transparency value of the portrait (0-255)
+        :param capture_condition: The capture condition to display on the poster
+        :param hooks: The hooks that receive the stage events, or None
+        :return: The base layer
+        """
+
         # Get portrait image
         if self.portrait is None:
-            portrait = BOUNTY_POSTER_NO_PHOTO_PATH
+            portrait_data = None
+            portrait_digest = BOUNTY_POSTER_NO_PHOTO_PATH
             portrait_vertical_align = VerticalAlignment.CENTER
             portrait_horizontal_align = HorizontalAlignment.CENTER
             should_make_portrait_transparent = False
         else:
-            portrait = self.portrait
-
-        # Get capture condition image
-        if capture_condition is CaptureCondition.ONLY_DEAD:
-            capture_condition_image_path = BOUNTY_POSTER_CAPTURE_CONDITION_ONLY_DEAD_PATH
-        elif capture_condition is CaptureCondition.ONLY_ALIVE:
-            capture_condition_image_path = BOUNTY_POSTER_CAPTURE_CONDITION_ONLY_ALIVE_PATH
-        else:
-            capture_condition_image_path = BOUNTY_POSTER_CAPTURE_CONDITION_DEAD_OR_ALIVE_PATH
-
-        # Open poster template
-        poster_template = Image.open(BOUNTY_POSTER_TEMPLATE_PATH).convert("RGBA")
+            portrait_data, portrait_digest = self.__get_portrait_data()
+
+        # Get capture condition image path
+        capture_condition_image_path = CAPTURE_CONDITION_IMAGE_PATHS.get(
+            capture_condition, BOUNTY_POSTER_CAPTURE_CONDITION_DEAD_OR_ALIVE_PATH)
+
+        cache_key = (portrait_digest, portrait_horizontal_align, portrait_vertical_align,
+                     portrait_transparency_value if should_make_portrait_transparent else None,
+                     capture_condition_image_path)
+        if BASE_LAYER_CACHE.enabled:
+            base_layer = BASE_LAYER_CACHE.get(cache_key)
+            if base_layer is not None:
+                return base_layer
+
+        # Open and resize portrait
+        with stage_event(hooks, RenderStage.PORTRAIT_RESIZE) as event:
+            if portrait_data is None:
+                portrait = self.__resize_portrait(ASSET_REGISTRY.get_image(BOUNTY_POSTER_NO_PHOTO_PATH, copy=False))
+            else:
+                portrait = self.__open_portrait(portrait_data)
+            event.size = portrait.size
+
+        # Get poster template
+        with stage_event(hooks, RenderStage.TEMPLATE_OPEN) as event:
+            poster_template = ASSET_REGISTRY.get_image(BOUNTY_POSTER_TEMPLATE_PATH, 'RGBA', copy=False)
+            event.size = poster_template.size
 
         # Create a new image with the same size as the template
-        new_image = Image.new("RGB", poster_template.size)
+        base_layer = Image.new("RGB", poster_template.size)
 
         # Paste portrait texture into new image
-        texture_portrait = Image.open(BOUNTY_POSTER_PORTRAIT_TEXTURE_PATH)
-        new_image.paste(texture_portrait, (BOUNTY_POSTER_PORTRAIT_BOX_START_X, BOUNTY_POSTER_PORTRAIT_BOX_START_Y))
-
-        # Open portrait image
-        portrait = Image.open(portrait)
-        # Resize portrait
-        portrait = self.__resize_portrait(portrait)
+        texture_portrait = ASSET_REGISTRY.get_image(BOUNTY_POSTER_PORTRAIT_TEXTURE_PATH, copy=False)
+        base_layer.paste(texture_portrait, (BOUNTY_POSTER_PORTRAIT_BOX_START_X, BOUNTY_POSTER_PORTRAIT_BOX_START_Y))
 
         # Align portrait image
-        portrait_coordinate_x, portrait_coordinate_y = self.__align_image(portrait, portrait_vertical_align,
-                                                                          portrait_horizontal_align)
+        with stage_event(hooks, RenderStage.PORTRAIT_ALIGN) as event:
+            portrait_coordinate_x, portrait_coordinate_y = self.__align_image(portrait, portrait_vertical_align,
+                                                                              portrait_horizontal_align)
+            event.size = portrait.size
 
         # Paste portrait into new image
         if should_make_portrait_transparent:
@@ -193,41 +607,95 @@ class WantedPoster:
             mask = portrait
         else:
             mask = None
-        new_image.paste(portrait, (portrait_coordinate_x, portrait_coordinate_y), mask)
+        base_layer.paste(portrait, (portrait_coordinate_x, portrait_coordinate_y), mask)
 
         # Paste poster template onto the new image
-        new_image.paste(poster_template, (0, 0), mask=poster_template)
+        base_layer.paste(poster_template, (0, 0), mask=poster_template)
 
         # Add capture condition component
-        capture_condition_image = Image.open(capture_condition_image_path)
-        new_image.paste(capture_condition_image, (BOUNTY_POSTER_CAPTURE_CONDITION_START_X,
-                                                  BOUNTY_POSTER_CAPTURE_CONDITION_START_Y))
+        capture_condition_image = ASSET_REGISTRY.get_image(capture_condition_image_path, copy=False)
+        base_layer.paste(capture_condition_image, (BOUNTY_POSTER_CAPTURE_CONDITION_START_X,
+                                                   BOUNTY_POSTER_CAPTURE_CONDITION_START_Y))
 
-        # Add name component
-        full_name = self.__get_bounty_poster_name(full_name_max_length, use_space_sub)
-        name_component: Image = self.__get_bounty_poster_component(full_name, BOUNTY_POSTER_COMPONENT_NAME)
-        new_image.paste(name_component, (0, BOUNTY_POSTER_NAME_START_Y), name_component)
+        if BASE_LAYER_CACHE.enabled:
+            BASE_LAYER_CACHE.put(cache_key, base_layer)
 
-        # Add belly component
-        belly = '{0:,}'.format(self.bounty) + '-'
-        belly_component: Image = self.__get_bounty_poster_component(belly, BOUNTY_POSTER_COMPONENT_BELLY)
-        new_image.paste(belly_component, (0, BOUNTY_POSTER_BELLY_START_Y), belly_component)
+        return base_layer
+
+    def __get_portrait_data(self) -> Tuple[bytes, str]:
+        """
+        Gets the content of the portrait image and its digest, reading it only once
+        :return: The portrait image content and its digest
+        """
+
+        if self.__portrait_data is None or self.__portrait_data[0] is not self.portrait:
+            import hashlib  # Imported here, it is slow to import and only needed once there is a portrait
+
+            portrait_data = self.__read_portrait()
+            self.__portrait_data = (self.portrait, portrait_data,
+                                    hashlib.blake2b(portrait_data, digest_size=16).hexdigest())
+
+        return self.__portrait_data[1], self.__portrait_data[2]
+
+    def __read_portrait(self) -> bytes:
+        """
+        Reads the content of the portrait image
+        :return: The portrait image content
+        """
+
+        # Paths and file objects are accepted as by Image.open
+        if isinstance(self.portrait, (str, bytes, os.PathLike)):
+            with open(os.fspath(self.portrait), 'rb') as portrait_file:
+                return portrait_file.read()
+
+        if hasattr(self.portrait, 'getvalue'):
+            return self.portrait.getvalue()
+
+        try:
+            self.portrait.seek(0)
+        except (AttributeError, UnsupportedOperation):  # Unseekable streams are read from where they are
+            pass
+
+        return self.portrait.read()
+
+    @staticmethod
+    def generate_many(specs: Iterable['PosterSpec'], max_workers: int = None, max_in_flight: int = None
+                      ) -> Iterator['BatchResult']:
+        """
+        Renders many posters in parallel across a process pool, yielding the results as they finish.
+        See batch.render_batch
+        :param specs: The poster specifications
+        :param max_workers: The number of worker processes. If None, the number of CPUs
+        :param max_in_flight: The maximum number of renders pending at any time. If None, twice the number of workers
+        :return: An iterator of the results, one for each specification
+        """
 
-        # Add stamp
-        if stamp is not None:
-            stamp_image = Image.open(STAMP_IMAGE_PATHS[stamp])
-            new_image.paste(stamp_image, (BOUNTY_POSTER_STAMP_START_X, BOUNTY_POSTER_STAMP_START_Y), mask=stamp_image)
+        from .batch import render_batch
 
-        # Add effects
-        for effect in effects:
-            effect_image = Image.open(EFFECT_IMAGE_PATHS[effect]).convert("RGBA")
-            new_image.paste(effect_image, (0, 0), mask=effect_image)
+        return render_batch(specs, max_workers=max_workers, max_in_flight=max_in_flight)
 
-        # Save image
-        save_path = output_poster_path
-        new_image.save(save_path)
+    @staticmethod
+    def get_image_format(output_format: Union[str, None], default_extension: str = None) -> Union[str, None]:
+        """
+        Gets the PIL format name from a format or file extension (e.g. 'jpg' -> 'JPEG')
+        :param output_format: The format or extension. If None, default_extension is used
+        :param default_extension: The extension to use if output_format is None
+        :return: The PIL format name, or None if both are None (PIL will infer it from the file name)
+        """
+
+        if output_format is None:
+            if default_extension is None:
+                return None
+            output_format = default_extension
+
+        # The common formats are known without importing every PIL plugin, which is slow
+        extension = '.' + output_format.lower().lstrip('.')
+        Image.preinit()
+        image_format = Image.EXTENSION.get(extension)
+        if image_format is None:
+            image_format = Image.registered_extensions().get(extension, output_format.upper())
 
-        return save_path
+        return image_format
 
     @staticmethod
     def __align_image(portrait: Image, vertical_align: VerticalAlignment, horizontal_align: HorizontalAlignment
@@ -261,6 +729,48 @@ class WantedPoster:
 
         return portrait_x, portrait_y
 
+    @staticmethod
+    def __open_portrait(portrait_data: bytes) -> Image:
+        """
+        Decodes a portrait image and resizes it to fit the wanted poster.
+        JPEG portraits are decoded at the smallest scale that is not below the final size, and other formats are
+        reduced before the final resample, so large photos are never fully decoded and resampled
+        :param portrait_data: The portrait image content
+        :return: The resized portrait image, in RGB mode
+        """
+
+        # Imported here, they are slow to import and only needed once there is a portrait
+        from PIL import ExifTags, ImageOps
+
+        portrait = Image.open(BytesIO(portrait_data))
+
+        # Reject huge images before decoding them, only the header has been read so far
+        portrait_width, portrait_height = portrait.size
+        if portrait_width * portrait_height > BOUNTY_POSTER_PORTRAIT_MAX_PIXELS:
+            raise ValueError(f'Portrait is too large ({portrait_width}x{portrait_height}), '
+                             f'max {BOUNTY_POSTER_PORTRAIT_MAX_PIXELS} pixels')
+
+        # Width and height are swapped once the EXIF orientation is applied
+        orientation = portrait.getexif().get(ExifTags.Base.Orientation, 1)
+        is_transposed = orientation in (5, 6, 7, 8)
+        if is_transposed:
+            portrait_width, portrait_height = portrait_height, portrait_width
+
+        new_width, new_height = WantedPoster.__get_portrait_size(portrait_width, portrait_height)
+
+        # Let the JPEG decoder downscale while decoding
+        portrait.draft(None, (new_height, new_width) if is_transposed else (new_width, new_height))
+
+        portrait = ImageOps.exif_transpose(portrait)
+        if portrait.mode != 'RGB':
+            portrait = portrait.convert('RGB')
+
+        # Resize portrait
+        portrait = portrait.resize((new_width, new_height), Image.Resampling.LANCZOS,
+                                   reducing_gap=BOUNTY_POSTER_PORTRAIT_REDUCING_GAP)
+
+        return portrait
+
     @staticmethod
     def __resize_portrait(portrait: Image) -> Image:
         """
@@ -269,8 +779,17 @@ class WantedPoster:
         :return: The resized portrait image
         """
 
-        # Get portrait size
-        portrait_width, portrait_height = portrait.size
+        # Resize portrait
+        return portrait.resize(WantedPoster.__get_portrait_size(*portrait.size), Image.Resampling.LANCZOS)
+
+    @staticmethod
+    def __get_portrait_size(portrait_width: int, portrait_height: int) -> Tuple[int, int]:
+        """
+        Calculates the size a portrait image must be resized to, to fill the wanted poster image box
+        :param portrait_width: The portrait width
+        :param portrait_height: The portrait height
+        :return: The new portrait size
+        """
 
         # Calculate wanted poster image box aspect ratio
         image_box_aspect_ratio = BOUNTY_POSTER_PORTRAIT_BOX_W / BOUNTY_POSTER_PORTRAIT_BOX_H
@@ -294,12 +813,9 @@ class WantedPoster:
             new_width = BOUNTY_POSTER_PORTRAIT_BOX_W
             new_height = BOUNTY_POSTER_PORTRAIT_BOX_H
 
-        # Resize portrait
-        portrait = portrait.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-        return portrait
+        return new_width, new_height
 
-    def __get_bounty_poster_name(self, max_length: Union[int, None], use_space_sub) -> str:
+    def _get_bounty_poster_name(self, max_length: Union[int, None], use_space_sub) -> str:
         """
         Gets the bounty poster's name of a user
         :param max_length: The maximum length of the name
@@ -320,8 +836,16 @@ class WantedPoster:
 
         return full_name
 
+    def _get_bounty_poster_belly(self) -> str:
+        """
+        Gets the bounty poster's belly text of a user
+        :return: The belly text
+        """
+
+        return '{0:,}'.format(self.bounty) + '-'
+
     @staticmethod
-    def __get_bounty_poster_component(text: str, c_type: int) -> Image:
+    def _get_bounty_poster_component(text: str, c_type: int) -> Image:
         """
         Get a component of the poster
         :param text: Text to be written
@@ -329,76 +853,56 @@ class WantedPoster:
         :return: Component image
         """
 
+        texture_background, alpha = WantedPoster._get_bounty_poster_component_layers(text, c_type)
+        texture_background = texture_background.copy()
+
+        # Use text cutout as alpha channel for texture image
+        texture_background.putalpha(alpha)
+
+        return texture_background
+
+    @staticmethod
+    def _get_bounty_poster_component_layers(text: str, c_type: int) -> Tuple[Image.Image, Image.Image]:
+        """
+        Get the texture and the text cutout of a component of the poster, without combining them.
+        Both images are shared and must not be modified
+        :param text: Text to be written
+        :param c_type: Type of component (1 - name, 2 - belly)
+        :return: Component texture and text cutout
+        """
+
         if c_type == BOUNTY_POSTER_COMPONENT_NAME:  # Name component
             texture_path = BOUNTY_POSTER_NAME_TEXTURE_PATH
-            font_path = BOUNTY_POSTER_NAME_FONT_PATH
-            font_size = BOUNTY_POSTER_NAME_FONT_SIZE
-            max_w = BOUNTY_POSTER_NAME_MAX_W
-            max_kern = BOUNTY_POSTER_NAME_MAX_KERN
-            x_pos = BOUNTY_POSTER_NAME_START_X
-            box_h = BOUNTY_POSTER_NAME_H
-
         elif c_type == BOUNTY_POSTER_COMPONENT_BELLY:  # Belly component
             texture_path = BOUNTY_POSTER_BELLY_TEXTURE_PATH
-            font_path = BOUNTY_POSTER_BELLY_FONT_PATH
-            font_size = BOUNTY_POSTER_BELLY_FONT_SIZE
-            max_w = BOUNTY_POSTER_BELLY_MAX_W
-            max_kern = BOUNTY_POSTER_BELLY_MAX_KERN
-            x_pos = BOUNTY_POSTER_BELLY_START_X
-            box_h = BOUNTY_POSTER_BELLY_H
         else:
             raise Exception('Invalid component type')
 
-        texture_background: Image = Image.open(texture_path)
-        texture_background_w, texture_background_h = texture_background.size
-        font: ImageFont = ImageFont.truetype(font_path, font_size)
-
-        # Create new alpha channel - solid black
-        # Alpha with more height to account for characters that are cut off under
-        alpha: Image = Image.new('L', (texture_background_w, texture_background_h))
-        draw: ImageDraw = ImageDraw.Draw(alpha)
-
-        # Get text size
-        should_scale: bool = False
-        text_w = draw.textlength(text, font=font)
-
-        if text_w < max_w:
-            width_difference = max_w - text_w
-            try:
-                kern = int(width_difference / (len(text) - 1))
-            except ZeroDivisionError:
-                kern = int(width_difference / (len(text)))
-
-            # Avoid too much kerning
-            if kern > max_kern:
-                kern = max_kern
-                x_pos += int((max_w / 2) - ((text_w + (kern * (len(text) - 1))) / 2))
-
-            # Draw char by char considering kerning
-            for char in text:
-                draw.text((x_pos, box_h), char, font=font, fill='white', anchor='ls')
-                char_width = draw.textlength(char, font=font)
-                x_pos += char_width + kern
-        else:
-            # If width is too big, increase alpha channel width
-            if text_w > max_w:
-                # Calculate new width
-                new_w = int((text_w * texture_background_w) / max_w)
-                alpha = Image.new('L', (new_w, texture_background_h))
-                draw = ImageDraw.Draw(alpha)
-                should_scale = True
+        texture_background: Image = ASSET_REGISTRY.get_image(texture_path, copy=False)
 
-            # Draw text on baseline in the image
-            draw.text((int(alpha.size[0] / 2), box_h), text, font=font, fill='white', anchor='ms')
+        # Rendered text cutouts are cached, since the same names and bounties are drawn over and over
+        cache_key = (text, c_type)
+        alpha: Image = COMPONENT_ALPHA_CACHE.get(cache_key) if COMPONENT_ALPHA_CACHE.enabled else None
+        if alpha is None:
+            alpha = WantedPoster.__get_bounty_poster_component_alpha(text, c_type, texture_background.size)
+            if COMPONENT_ALPHA_CACHE.enabled:
+                COMPONENT_ALPHA_CACHE.put(cache_key, alpha)
 
-            # Scale texture image if needed
-            if should_scale:
-                alpha = alpha.resize((texture_background_w, texture_background_h))
+        return texture_background, alpha
 
-        # Use text cutout as alpha channel for texture image
-        texture_background.putalpha(alpha)
+    @staticmethod
+    def __get_bounty_poster_component_alpha(text: str, c_type: int, texture_size: Tuple[int, int]) -> Image:
+        """
+        Get the text cutout of a component of the poster, to be used as alpha channel of its texture
+        :param text: Text to be written
+        :param c_type: Type of component (1 - name, 2 - belly)
+        :param texture_size: Size of the component texture
+        :return: Text cutout image
+        """
 
-        return texture_background
+        layout_engine: TextLayoutEngine = TEXT_LAYOUT_ENGINES[c_type]
+
+        return layout_engine.draw(layout_engine.get_layout(text, texture_size[0]), texture_size)
 
     def __get_full_name(self, max_length: Union[int, None]) -> str:
         """
@@ -407,6 +911,9 @@ class WantedPoster:
         :return: The full name
         """
 
+        # Imported here, to keep the import of this module fast
+        from unidecode import unidecode
+
         # Normalize to ascii, for non latin characters
         first_name = unidecode(self.first_name).upper().strip()
         last_name = unidecode(self.last_name).upper().strip()
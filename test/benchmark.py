@@ -0,0 +1,262 @@
+"""
+Headless benchmark of the poster rendering pipeline.
+
+Renders every combination of portrait size, name, bounty and overlays, and reports the throughput, the latency
+percentiles of each stage and the peak RSS. Run from the repository root:
+
+    python test/benchmark.py --iterations 10 --output benchmark.json
+
+By default the base layer and text cutout caches are disabled, and the text layouts, glyphs and merged overlay layers
+are cleared before each iteration, so every iteration goes through the full pipeline. The decoded assets are kept,
+their loading is measured separately. Use --warm to measure with all the caches enabled.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+from collections import defaultdict
+from io import BytesIO
+from itertools import product
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from src.wantedposter import wantedposter  # noqa: E402
+from src.wantedposter.instrumentation import RenderHooks, RenderStage  # noqa: E402
+from src.wantedposter.wantedposter import WantedPoster, OutputType, Effect, Stamp  # noqa: E402
+
+PORTRAIT_SIZES = {
+    'small': (640, 480),
+    'medium': (1920, 1080),
+    'large': (4032, 3024)
+}
+
+# (first name, last name)
+NAMES = {
+    'short': ('Zoro', ''),
+    'long': ('Bartholomew Kuma', 'Tyrant'),
+    'space_sub': ('Vivi', 'Nefertari'),
+    'd': ('Luffy', 'Monkey D.')
+}
+
+BOUNTIES = {
+    'zero': 0,
+    'million': 1_000_000,
+    'billion': 3_000_000_000
+}
+
+# (stamp, effects)
+OVERLAYS = {
+    'none': (None, []),
+    'stamp': (Stamp.WARLORD, []),
+    'effects': (None, [Effect.FROST, Effect.LIGHTNING]),
+    'stamp_effects': (Stamp.FLEE_ON_SIGHT, [Effect.FROST, Effect.LIGHTNING])
+}
+
+STAGES = ['portrait', 'compositing', 'name', 'belly', 'overlays', 'encode']
+
+# Benchmark stage of each render stage. Compositing is computed as base layer minus portrait
+RENDER_STAGES = {
+    RenderStage.BASE_LAYER: 'base_layer',
+    RenderStage.PORTRAIT_RESIZE: 'portrait',
+    RenderStage.NAME_COMPONENT: 'name',
+    RenderStage.BELLY_COMPONENT: 'belly',
+    RenderStage.OVERLAYS: 'overlays',
+    RenderStage.SAVE: 'encode'
+}
+
+
+class StageDurationHooks(RenderHooks):
+    """
+    Accumulates the durations of the stages of a render
+    """
+
+    def __init__(self) -> None:
+        self.durations: dict[str, float] = defaultdict(float)
+
+    def on_stage_end(self, stage: RenderStage, duration: float, size) -> None:
+        stage_key = RENDER_STAGES.get(stage)
+        if stage_key is not None:
+            self.durations[stage_key] += duration
+
+
+def create_portrait(size: tuple[int, int]) -> bytes:
+    """
+    Creates a synthetic JPEG portrait, with enough detail to be representative of a photo
+    :param size: The portrait size
+    :return: The JPEG content
+    """
+
+    rng = random.Random(size[0] * size[1])
+    noise = Image.frombytes('L', (size[0] // 8, size[1] // 8), rng.randbytes((size[0] // 8) * (size[1] // 8)))
+    portrait = Image.merge('RGB', [Image.linear_gradient('L').resize(size),
+                                   noise.resize(size, Image.Resampling.BICUBIC),
+                                   Image.radial_gradient('L').resize(size)])
+
+    portrait_bytes = BytesIO()
+    portrait.save(portrait_bytes, 'JPEG', quality=90)
+    return portrait_bytes.getvalue()
+
+
+def percentile(values: list[float], p: float) -> float:
+    """
+    Gets a percentile of a list of values (nearest rank)
+    :param values: The values
+    :param p: The percentile (0-100)
+    :return: The value at the percentile
+    """
+
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, int(round(p / 100 * len(values))) - 1))
+    return values[index]
+
+
+def summarize(values: list[float]) -> dict[str, float]:
+    """
+    Summarizes a list of durations in milliseconds
+    :param values: The durations, in seconds
+    :return: The mean and p50, p95 and p99 latency, in milliseconds
+    """
+
+    return {'mean_ms': sum(values) / len(values) * 1000,
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000}
+
+
+def get_peak_rss_mb() -> float:
+    """
+    Gets the peak resident set size of the process so far
+    :return: The peak RSS, in MB
+    """
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes on Linux
+    return peak_rss / (1024 * 1024) if sys.platform == 'darwin' else peak_rss / 1024
+
+
+def benchmark_asset_load(iterations: int) -> dict[str, float]:
+    """
+    Measures the time to decode all the static assets and pre-render the overlay layers
+    :param iterations: The number of iterations
+    :return: The latency summary
+    """
+
+    durations = []
+    for _ in range(iterations):
+        wantedposter.ASSET_REGISTRY.clear()
+        clear_render_caches()
+        start = time.perf_counter()
+        wantedposter.preload_assets()
+        durations.append(time.perf_counter() - start)
+
+    return summarize(durations)
+
+
+def clear_render_caches() -> None:
+    """
+    Clears the text layouts, glyphs and merged overlay layers, so that the next render computes them again
+    :return: None
+    """
+
+    for layout_engine in wantedposter.TEXT_LAYOUT_ENGINES.values():
+        layout_engine.clear()
+    for glyph_cache in wantedposter.GLYPH_CACHES.values():
+        glyph_cache.clear()
+    wantedposter.OVERLAY_SHEET.clear()
+
+
+def benchmark_case(portrait: bytes, first_name: str, last_name: str, bounty: int, stamp: Stamp,
+                   effects: list[Effect], iterations: int, warm: bool) -> dict:
+    """
+    Renders a poster several times and measures each stage
+    :param portrait: The portrait content
+    :param first_name: The first name
+    :param last_name: The last name
+    :param bounty: The bounty
+    :param stamp: The stamp
+    :param effects: The effects
+    :param iterations: The number of iterations
+    :param warm: Whether to keep the render caches between iterations
+    :return: The results of the case
+    """
+
+    totals = []
+    stages = defaultdict(list)
+    for _ in range(iterations):
+        if not warm:
+            clear_render_caches()
+
+        hooks = StageDurationHooks()
+        start = time.perf_counter()
+        WantedPoster(BytesIO(portrait), first_name, last_name, bounty).generate(
+            stamp=stamp, effects=effects, output_type=OutputType.BYTES, hooks=hooks)
+        totals.append(time.perf_counter() - start)
+
+        # Compositing is the base layer without the portrait decoding
+        hooks.durations['compositing'] = hooks.durations.pop('base_layer', 0) - hooks.durations['portrait']
+        for stage in STAGES:
+            stages[stage].append(hooks.durations[stage])
+
+    return {'throughput_per_s': iterations / sum(totals),
+            'total': summarize(totals),
+            'stages': {stage: summarize(durations) for stage, durations in stages.items()},
+            'peak_rss_mb': get_peak_rss_mb()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the wanted poster rendering pipeline')
+    parser.add_argument('--iterations', type=int, default=5, help='Renders per case')
+    parser.add_argument('--warm', action='store_true', help='Keep all the render caches enabled')
+    parser.add_argument('--quick', action='store_true', help='Only benchmark the first value of each dimension')
+    parser.add_argument('--output', help='Path of the JSON report. If not set, it is written to stdout')
+    args = parser.parse_args()
+
+    if not args.warm:
+        wantedposter.BASE_LAYER_CACHE.max_bytes = 0
+        wantedposter.COMPONENT_ALPHA_CACHE.max_bytes = 0
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'pillow': Image.__version__,
+        'iterations': args.iterations,
+        'warm': args.warm,
+        'asset_load': benchmark_asset_load(args.iterations),
+        'cases': []
+    }
+
+    dimensions = [PORTRAIT_SIZES, NAMES, BOUNTIES, OVERLAYS]
+    if args.quick:
+        dimensions = [dict([next(iter(dimension.items()))]) for dimension in dimensions]
+
+    # Portrait sizes are the outer loop and go from small to large, so the peak RSS is attributable to each size
+    for portrait_size_key in dimensions[0]:
+        portrait = create_portrait(PORTRAIT_SIZES[portrait_size_key])
+        for name_key, bounty_key, overlay_key in product(*dimensions[1:]):
+            first_name, last_name = NAMES[name_key]
+            stamp, effects = OVERLAYS[overlay_key]
+            result = benchmark_case(portrait, first_name, last_name, BOUNTIES[bounty_key], stamp, effects,
+                                    args.iterations, args.warm)
+            result.update({'portrait_size': portrait_size_key, 'name': name_key, 'bounty': bounty_key,
+                           'overlays': overlay_key})
+            report['cases'].append(result)
+
+            print(f"{portrait_size_key:>6} {name_key:>9} {bounty_key:>7} {overlay_key:>13}  "
+                  f"p50 {result['total']['p50_ms']:7.1f} ms  p99 {result['total']['p99_ms']:7.1f} ms  "
+                  f"{result['throughput_per_s']:6.1f}/s  rss {result['peak_rss_mb']:6.1f} MB", file=sys.stderr)
+
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,6 @@
 import os
 
-from PIL import Image
-
-from src.wantedposter.wantedposter import WantedPoster
+from src.wantedposter.wantedposter import WantedPoster, OutputType
 
 
 def main():
@@ -19,14 +17,11 @@ def main():
     # Create WantedPoster object
     wanted_poster = WantedPoster(portrait_path, first_name, last_name, bounty_amount)
 
-    # Generate poster
-    path = wanted_poster.generate(should_make_portrait_transparent=True)
+    # Generate poster in memory
+    image = wanted_poster.generate(should_make_portrait_transparent=True, output_type=OutputType.IMAGE)
 
     # Show image
-    Image.open(path).show()
-
-    # Delete generated image
-    os.remove(path)
+    image.show()
 
 
 if __name__ == '__main__':
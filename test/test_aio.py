@@ -0,0 +1,44 @@
+import asyncio
+import os
+import pathlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+
+from src.wantedposter.aio import AsyncWantedPoster, _read_portrait
+
+PORTRAIT_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'luffy.jpg')
+
+
+def test_timed_out_render_keeps_its_slot():
+    release = threading.Event()
+    started = []
+
+    def render(spec):
+        started.append(spec.first_name)
+        release.wait(5)
+        return spec.first_name.encode()
+
+    async def run():
+        poster = AsyncWantedPoster(ThreadPoolExecutor(2), max_concurrency=1)
+
+        with pytest.raises(asyncio.TimeoutError):
+            await poster.generate(first_name='Luffy', timeout=0.1)
+
+        # The first render is still running, so the second one waits for its slot
+        second = asyncio.ensure_future(poster.generate(first_name='Zoro'))
+        await asyncio.sleep(0.2)
+        assert started == ['Luffy']
+
+        release.set()
+        assert await second == b'Zoro'
+        assert started == ['Luffy', 'Zoro']
+
+    with mock.patch('src.wantedposter.aio.render_poster_spec', render):
+        asyncio.run(run())
+
+
+def test_read_path_like_portrait():
+    assert asyncio.run(_read_portrait(pathlib.Path(PORTRAIT_PATH))) == PORTRAIT_PATH
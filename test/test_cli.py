@@ -0,0 +1,50 @@
+import os
+
+from src.wantedposter.cli import DirectoryWriter, generate_posters, parse_csv_row
+
+PORTRAIT_PATH = os.path.join(os.path.dirname(__file__), 'luffy.jpg')
+
+
+def test_parse_csv_row():
+    item = parse_csv_row({'id': 'luffy', 'bounty': ' 3000000000 ', 'effects': 'FROST; ;LIGHTNING',
+                          'use_space_sub': 'true', 'stamp': ''})
+
+    assert item == {'id': 'luffy', 'bounty': '3000000000', 'effects': ['FROST', 'LIGHTNING'], 'use_space_sub': True}
+
+
+def test_results_match_items(tmp_path):
+    items = [
+        (1, {'id': 'luffy', 'portrait': PORTRAIT_PATH, 'first_name': 'Luffy', 'bounty': 3_000_000_000}),
+        (2, ValueError('Item must be a JSON object')),
+        (3, {'id': 'bad', 'stamp': 'NOPE'}),
+        (4, {'id': 'missing', 'portrait': str(tmp_path / 'missing.jpg')}),
+        (5, {'first_name': 'Nami', 'bounty': 366_000_000}),
+    ]
+    results = []
+
+    # Rendering one poster at a time finishes each one before the next is submitted
+    counts = generate_posters(items, DirectoryWriter(str(tmp_path / 'posters')), results.append, max_workers=1,
+                              max_in_flight=1)
+
+    assert counts == {'ok': 2, 'skipped': 0, 'error': 3}
+    assert {result['line']: (result['status'], result.get('output')) for result in results} == {
+        1: ('ok', 'luffy.jpg'),
+        2: ('error', None),
+        3: ('error', 'bad.jpg'),
+        4: ('error', 'missing.jpg'),
+        5: ('ok', '5.jpg'),
+    }
+    assert sorted(os.listdir(tmp_path / 'posters')) == ['5.jpg', 'luffy.jpg']
+
+
+def test_resume_skips_existing_posters(tmp_path):
+    writer = DirectoryWriter(str(tmp_path))
+    writer.write('luffy.jpg', b'poster')
+    results = []
+
+    counts = generate_posters([(1, {'id': 'luffy', 'first_name': 'Luffy'})], writer, results.append, resume=True,
+                              max_workers=1)
+
+    assert counts == {'ok': 0, 'skipped': 1, 'error': 0}
+    assert results == [{'line': 1, 'output': 'luffy.jpg', 'status': 'skipped'}]
+    assert (tmp_path / 'luffy.jpg').read_bytes() == b'poster'
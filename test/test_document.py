@@ -0,0 +1,82 @@
+import os
+
+import pytest
+from PIL import ImageChops
+
+from src.wantedposter.document import PosterDocument
+from src.wantedposter.wantedposter import WantedPoster, OutputType, CaptureCondition, Effect, Stamp
+
+PORTRAIT_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'luffy.jpg')
+
+INITIAL_STATE = dict(first_name='Luffy', last_name='Monkey D.', bounty=3_000_000_000,
+                     capture_condition=CaptureCondition.DEAD_OR_ALIVE, stamp=Stamp.WARLORD, effects=[Effect.FROST])
+
+# (update, changes to the state)
+UPDATES = {
+    'set_bounty': (lambda document: document.set_bounty(5_564_800_000), dict(bounty=5_564_800_000)),
+    'set_name': (lambda document: document.set_name('Zoro', 'Roronoa'), dict(first_name='Zoro', last_name='Roronoa')),
+    'set_capture_condition': (lambda document: document.set_capture_condition(CaptureCondition.ONLY_ALIVE),
+                              dict(capture_condition=CaptureCondition.ONLY_ALIVE)),
+    'set_stamp': (lambda document: document.set_stamp(Stamp.FLEE_ON_SIGHT), dict(stamp=Stamp.FLEE_ON_SIGHT)),
+    'remove_stamp': (lambda document: document.set_stamp(None), dict(stamp=None)),
+    'add_effect': (lambda document: document.add_effect(Effect.LIGHTNING),
+                   dict(effects=[Effect.FROST, Effect.LIGHTNING])),
+    'remove_effect': (lambda document: document.remove_effect(Effect.FROST), dict(effects=[]))
+}
+
+
+def generate(portrait, state):
+    state = dict(state)
+    wanted_poster = WantedPoster(portrait, state.pop('first_name'), state.pop('last_name'), state.pop('bounty'))
+    return wanted_poster.generate(output_type=OutputType.IMAGE, **state)
+
+
+def create_document(portrait, state):
+    return PosterDocument(WantedPoster(portrait, state['first_name'], state['last_name'], state['bounty']),
+                          capture_condition=state['capture_condition'], effects=state['effects'],
+                          stamp=state['stamp'])
+
+
+def assert_identical(image, expected):
+    assert image.size == expected.size
+    assert ImageChops.difference(image.convert('RGB'), expected.convert('RGB')).getbbox() is None
+
+
+@pytest.mark.parametrize('portrait', [PORTRAIT_PATH, None])
+def test_document_is_identical(portrait):
+    assert_identical(create_document(portrait, INITIAL_STATE).image, generate(portrait, INITIAL_STATE))
+
+
+@pytest.mark.parametrize('update', UPDATES)
+@pytest.mark.parametrize('portrait', [PORTRAIT_PATH, None])
+def test_update_is_identical(portrait, update):
+    update_function, changes = UPDATES[update]
+    document = create_document(portrait, INITIAL_STATE)
+
+    update_function(document)
+
+    assert_identical(document.image, generate(portrait, {**INITIAL_STATE, **changes}))
+
+
+def test_successive_updates_are_identical():
+    document = create_document(PORTRAIT_PATH, INITIAL_STATE)
+    state = dict(INITIAL_STATE)
+
+    for update in ('set_bounty', 'set_capture_condition', 'add_effect', 'set_stamp', 'set_name', 'remove_stamp',
+                   'set_bounty'):
+        update_function, changes = UPDATES[update]
+        update_function(document)
+        state.update(changes)
+        assert_identical(document.image, generate(PORTRAIT_PATH, state))
+
+    document.remove_effect(Effect.FROST)
+    assert_identical(document.image, generate(PORTRAIT_PATH, {**state, 'effects': [Effect.LIGHTNING]}))
+
+
+def test_saved_image_is_not_affected_by_updates():
+    document = create_document(PORTRAIT_PATH, INITIAL_STATE)
+    image = document.save(output_type=OutputType.IMAGE)
+
+    document.set_bounty(1)
+
+    assert_identical(image, generate(PORTRAIT_PATH, INITIAL_STATE))
@@ -0,0 +1,13 @@
+from src.wantedposter.wantedposter import GLYPH_CACHES, BOUNTY_POSTER_COMPONENT_BELLY, WantedPoster, OutputType
+
+
+def test_text_lengths_are_not_kept_per_text():
+    glyph_cache = GLYPH_CACHES[BOUNTY_POSTER_COMPONENT_BELLY]
+
+    for bounty in range(1_000_000, 1_000_000 + 500 * 7919, 7919):
+        WantedPoster(None, 'Luffy', 'Monkey D.', bounty).generate(output_type=OutputType.IMAGE)
+
+    # Only single characters are kept: digits, comma and dash
+    assert len(glyph_cache._char_lengths) <= 12
+    text = '1,000,000-'
+    assert glyph_cache.get_text_length(text) == sum(glyph_cache.get_text_length(char) for char in text)
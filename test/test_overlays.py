@@ -0,0 +1,38 @@
+from src.wantedposter.overlays import OverlaySheet
+from src.wantedposter.wantedposter import ASSET_REGISTRY, OVERLAY_SHEET, Effect, Stamp
+
+
+def create_sheet(max_combinations=2):
+    return OverlaySheet(ASSET_REGISTRY, OVERLAY_SHEET.overlays, max_combinations=max_combinations)
+
+
+def test_repeated_overlays_share_a_layer():
+    sheet = create_sheet()
+
+    layer = sheet.get_layer([Effect.FROST, Effect.LIGHTNING])
+    assert sheet.get_layer([Effect.FROST, Effect.LIGHTNING, Effect.FROST, Effect.LIGHTNING]) is layer
+    assert sheet.get_layer([Effect.FROST] * 3) is sheet.get_layer([Effect.FROST])
+    assert sheet.get_layer([]) is None
+
+
+def test_combinations_are_bounded():
+    sheet = create_sheet(max_combinations=2)
+    combinations = [[Effect.FROST, Effect.LIGHTNING], [Effect.LIGHTNING, Effect.FROST],
+                    [Stamp.WARLORD, Effect.FROST], [Stamp.WARLORD, Effect.LIGHTNING]]
+
+    for keys in combinations * 2:
+        sheet.get_layer(keys)
+
+    assert len(sheet._combinations) == 2
+    assert list(sheet._combinations) == [tuple(keys) for keys in combinations[-2:]]
+
+
+def test_precomputed_combinations_are_kept():
+    sheet = create_sheet(max_combinations=1)
+    sheet.precompute([(Stamp.WARLORD, Effect.FROST, Effect.FROST)])
+    layer = sheet.get_layer([Stamp.WARLORD, Effect.FROST])
+
+    sheet.get_layer([Effect.FROST, Effect.LIGHTNING])
+    sheet.get_layer([Effect.LIGHTNING, Effect.FROST])
+
+    assert sheet.get_layer([Stamp.WARLORD, Effect.FROST]) is layer
@@ -0,0 +1,43 @@
+import os
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from PIL import ImageChops
+
+from src.wantedposter.wantedposter import WantedPoster, OutputType
+
+PORTRAIT_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'luffy.jpg')
+
+
+class PortraitFile:
+    """
+    File object without getvalue, like an open file or a network stream
+    """
+
+    def __init__(self, data: bytes) -> None:
+        self._data = BytesIO(data)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._data.read(size)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self._data.seek(offset, whence)
+
+
+def get_portraits():
+    with open(PORTRAIT_PATH, 'rb') as portrait_file:
+        data = portrait_file.read()
+
+    read_file = PortraitFile(data)
+    read_file.read(100)
+
+    return [Path(PORTRAIT_PATH), PORTRAIT_PATH.encode(), BytesIO(data), read_file]
+
+
+@pytest.mark.parametrize('portrait', get_portraits())
+def test_portrait_types(portrait):
+    expected = WantedPoster(PORTRAIT_PATH, 'Luffy', 'Monkey D.', 1).generate(output_type=OutputType.IMAGE)
+    image = WantedPoster(portrait, 'Luffy', 'Monkey D.', 1).generate(output_type=OutputType.IMAGE)
+
+    assert ImageChops.difference(expected, image).getbbox() is None
@@ -0,0 +1,97 @@
+import os
+import time
+from unittest import mock
+
+from src.wantedposter.poster_cache import PosterCache
+from src.wantedposter.wantedposter import WantedPoster, OutputType, Stamp
+
+
+def set_last_used(path, seconds_ago):
+    last_used = time.time() - seconds_ago
+    os.utime(path, (last_used, last_used))
+
+
+def test_key_is_stable():
+    key = PosterCache.get_key('1.0', b'portrait', 'Luffy', 3_000_000_000, {'stamp': 'WARLORD', 'effects': []})
+
+    assert key == PosterCache.get_key('1.0', b'portrait', 'Luffy', 3_000_000_000, {'effects': [], 'stamp': 'WARLORD'})
+    assert key != PosterCache.get_key('1.0', b'portrait', 'Luffy', 3_000_000_001, {'stamp': 'WARLORD', 'effects': []})
+    # Parts are length-prefixed, so moving bytes between parts changes the key
+    assert PosterCache.get_key(b'ab', b'c') != PosterCache.get_key(b'a', b'bc')
+
+
+def test_hit_and_miss(tmp_path):
+    poster_cache = PosterCache(str(tmp_path))
+
+    assert poster_cache.get('abcd', 'jpg') is None
+    assert poster_cache.read('abcd', 'jpg') is None
+
+    path = poster_cache.put('abcd', 'jpg', b'poster')
+    assert poster_cache.get('abcd', 'jpg') == path
+    assert poster_cache.read('abcd', 'jpg') == b'poster'
+    assert (poster_cache.hits, poster_cache.misses) == (2, 2)
+
+
+def test_put_is_atomic(tmp_path):
+    poster_cache = PosterCache(str(tmp_path))
+    path = poster_cache.put('abcd', 'jpg', b'old')
+
+    # A failed write leaves the previous poster and no temporary file
+    with mock.patch('os.replace', side_effect=OSError('disk full')):
+        try:
+            poster_cache.put('abcd', 'jpg', b'new')
+        except OSError:
+            pass
+
+    assert poster_cache.read('abcd', 'jpg') == b'old'
+    assert os.listdir(os.path.dirname(path)) == [os.path.basename(path)]
+
+
+def test_evict_by_size(tmp_path):
+    poster_cache = PosterCache(str(tmp_path), max_bytes=250)
+    for index, key in enumerate(('aa01', 'aa02', 'aa03')):
+        set_last_used(poster_cache.put(key, 'jpg', b'x' * 100), 30 - index)
+
+    assert poster_cache.evict() == 1
+    assert poster_cache.get('aa01', 'jpg') is None
+    assert poster_cache.get('aa02', 'jpg') is not None
+    assert poster_cache.get('aa03', 'jpg') is not None
+
+
+def test_evict_by_age(tmp_path):
+    poster_cache = PosterCache(str(tmp_path), max_age=60)
+    set_last_used(poster_cache.put('aa01', 'jpg', b'old'), 120)
+    poster_cache.put('aa02', 'jpg', b'new')
+
+    # Expired posters are not returned, even before they are evicted
+    assert poster_cache.read('aa01', 'jpg') is None
+    assert poster_cache.evict() == 1
+    assert not os.path.exists(poster_cache.get_path('aa01', 'jpg'))
+    assert poster_cache.read('aa02', 'jpg') == b'new'
+
+
+def test_evict_on_interval_without_puts(tmp_path):
+    poster_cache = PosterCache(str(tmp_path), max_age=60, evict_interval=0)
+    set_last_used(poster_cache.put('aa01', 'jpg', b'old'), 120)
+
+    poster_cache.get('bb01', 'jpg')
+
+    assert not os.path.exists(poster_cache.get_path('aa01', 'jpg'))
+
+
+def test_generate_renders_when_evicted_concurrently(tmp_path):
+    poster_cache = PosterCache(str(tmp_path))
+    wanted_poster = WantedPoster(None, 'Luffy', 'Monkey D.', 1)
+    poster = wanted_poster.generate(output_type=OutputType.BYTES, stamp=Stamp.WARLORD, poster_cache=poster_cache)
+
+    # Another process removes the file between the lookup and the read
+    def open_evicted(path, *args, **kwargs):
+        os.remove(path)
+        return open(path, *args, **kwargs)
+
+    with mock.patch('src.wantedposter.poster_cache.open', open_evicted, create=True):
+        cached_poster = wanted_poster.generate(output_type=OutputType.BYTES, stamp=Stamp.WARLORD,
+                                               poster_cache=poster_cache)
+
+    assert cached_poster == poster
+    assert poster_cache.misses == 2
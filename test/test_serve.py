@@ -0,0 +1,83 @@
+import json
+import threading
+from concurrent.futures import Future
+from urllib.request import Request, urlopen
+
+import pytest
+
+from src.wantedposter.serve import RenderService, RenderHTTPServer, RenderRequestHandler
+
+
+class FinishedFutureExecutor:
+    """
+    Executor whose renders are already finished when submitted
+    """
+
+    def __init__(self) -> None:
+        self.submitted: int = 0
+
+    def submit(self, fn, *args) -> Future:
+        self.submitted += 1
+        future = Future()
+        future.set_result(b'poster')
+        return future
+
+    def shutdown(self, **kwargs) -> None:
+        pass
+
+
+class InlineExecutor(FinishedFutureExecutor):
+    """
+    Executor that renders in the calling thread
+    """
+
+    def submit(self, fn, *args) -> Future:
+        self.submitted += 1
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+def test_render_with_already_finished_future():
+    service = RenderService(max_workers=1)
+    service.shutdown()
+    service._executor = FinishedFutureExecutor()
+
+    results = []
+    for _ in range(2):
+        thread = threading.Thread(target=lambda: results.append(service.render({'first_name': 'Luffy'}, None)),
+                                  daemon=True)
+        thread.start()
+        thread.join(5)
+        assert not thread.is_alive(), 'render() deadlocked'
+
+    assert results == [b'poster', b'poster']
+    assert service.stats()['in_flight'] == 0
+    assert service._executor.submitted == 2
+
+
+@pytest.mark.parametrize('output_format, content_type, signature', [
+    (None, 'image/jpeg', b'\xff\xd8\xff'),
+    ('jpg', 'image/jpeg', b'\xff\xd8\xff'),
+    ('png', 'image/png', b'\x89PNG'),
+    ('WEBP', 'image/webp', b'RIFF'),
+])
+def test_content_type_matches_poster(output_format, content_type, signature):
+    service = RenderService(max_workers=1)
+    service.shutdown()
+    service._executor = InlineExecutor()
+    RenderRequestHandler.service = service
+    server = RenderHTTPServer(('127.0.0.1', 0), RenderRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        options = {'first_name': 'Luffy', 'bounty': 3_000_000_000, 'output_format': output_format}
+        request = Request(f'http://127.0.0.1:{server.server_address[1]}/generate', json.dumps(options).encode(),
+                          {'Content-Type': 'application/json'})
+        with urlopen(request, timeout=30) as response:
+            assert response.headers['Content-Type'] == content_type
+            assert response.read().startswith(signature)
+    finally:
+        server.shutdown()
+        server.server_close()